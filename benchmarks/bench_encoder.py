@@ -0,0 +1,136 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Benchmark for the compiled binary encoder and decoder
+Compares building one ctypes object per record (the previous write_ctype_objs)
+against the compiled encoder writing to a file and into a preallocated buffer,
+then decodes the buffer back into datagen objects
+
+usage:
+python benchmarks/bench_encoder.py [--count 100000] [--json results.json]
+"""
+import argparse
+import ctypes
+import io
+import json
+import os
+import tempfile
+import time
+from dataclasses import dataclass
+from enum import Enum
+
+from synthetic import Descriptor, MEM_REGIONS_E, dg
+from datagenDV import ctypes_helper
+
+
+def ctypes_records(objs):
+    """
+    One ctypes object per record, as write_ctype_objs did before the compiled encoder
+    Lists are converted by hand, the old path did not accept them
+    """
+    ctype_class = ctypes_helper.get_ctype_class(Descriptor)
+    field_types = dict(ctype_class._fields_)
+    fh = io.BytesIO()
+    for obj in objs:
+        values = {}
+        for name in field_types:
+            value = getattr(obj, name)
+            if isinstance(value, list):
+                value = field_types[name](*[MEM_REGIONS_E[element].value for element in value])
+            values[name] = value
+        fh.write(ctype_class(**values))
+    return fh.getvalue()
+
+
+@dataclass
+class Tagged(dg.YAMLParamsBase):
+    TAG      : ctypes.c_char  = dg.field(ord('A'))
+    LENGTH   : ctypes.c_uint8 = dg.field(1)
+
+Tagged.generate_hfields()
+
+
+def check_char_fields():
+    """c_char fields encode to the same bytes as the ctypes object and decode back"""
+    objs = [Tagged(), Tagged(TAG=ord('z'), LENGTH=255)]
+    ctype_class = ctypes_helper.get_ctype_class(Tagged)
+    reference = b''.join(bytes(ctype_class(TAG=obj.TAG, LENGTH=obj.LENGTH)) for obj in objs)
+    fh = io.BytesIO()
+    ctypes_helper.write_ctype_objs(objs, fh)
+    assert fh.getvalue() == reference == b'A\x01z\xff', fh.getvalue()
+    assert list(ctypes_helper.decode_ctype_objs(Tagged, reference)) == objs
+
+
+class Parity(Enum):
+    ODD = 1
+    EVEN = 3
+
+
+@dataclass
+class Mixed(dg.YAMLParamsBase):
+    PARITY   : Parity          = dg.field(Parity.EVEN)
+    COUNT    : ctypes.c_uint32 = dg.field(None)
+    TAG      : ctypes.c_char   = dg.field(ord('A'))
+    PARITIES : list            = dg.field(lambda: [Parity.ODD, "EVEN"])
+
+Mixed.generate_hfields({'PARITIES': (Parity, 3)})
+
+
+def check_numpy_writer():
+    """write_ctype_objs_numpy accepts what the compiled encoder accepts and writes the same bytes"""
+    objs = [Mixed(), Mixed(PARITY="ODD", COUNT=7, TAG=None, PARITIES=[])]
+    fh = io.BytesIO()
+    ctypes_helper.write_ctype_objs(objs, fh)
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'mixed.bin')
+        ctypes_helper.write_ctype_objs_numpy(objs, filename)
+        with open(filename, 'rb') as numpy_fh:
+            assert numpy_fh.read() == fh.getvalue(), "write_ctype_objs_numpy differs from write_ctype_objs"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    check_char_fields()
+    check_numpy_writer()
+    objs = [Descriptor(ADDRESS=0x1000 + i * 64, SIZE=64, FLAGS=i % 7, REGION=MEM_REGIONS_E.RAM,
+                       REGIONS=["ROM", "RAM"][:1 + i % 2]) for i in range(args.count)]
+    results = {}
+
+    start = time.perf_counter()
+    reference = ctypes_records(objs)
+    results['ctypes_objects'] = time.perf_counter() - start
+
+    fh = io.BytesIO()
+    start = time.perf_counter()
+    dg.ctypes_helper.write_ctype_objs(objs, fh)
+    results['write_ctype_objs'] = time.perf_counter() - start
+    assert fh.getvalue() == reference
+
+    buffer = bytearray(ctypes_helper.ctype_obj_size(Descriptor) * args.count)
+    start = time.perf_counter()
+    ctypes_helper.encode_ctype_objs(objs, buffer)
+    results['encode_ctype_objs'] = time.perf_counter() - start
+    assert bytes(buffer) == reference
+
+    start = time.perf_counter()
+    decoded = list(ctypes_helper.decode_ctype_objs(Descriptor, buffer))
+    results['decode_ctype_objs'] = time.perf_counter() - start
+    assert len(decoded) == args.count and decoded[-1].ADDRESS == objs[-1].ADDRESS
+
+    for name, elapsed in results.items():
+        speedup = '' if name.startswith('decode') else f"  {results['ctypes_objects'] / elapsed:5.2f}x"
+        print(f"{name:>18}: {elapsed / args.count * 1e6:7.2f} us/object{speedup}")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({'count': args.count, 'seconds': results}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
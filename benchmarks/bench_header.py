@@ -0,0 +1,66 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Benchmark for C header generation
+Times write_ctype_structs on many generated struct classes with scalar and
+multi-dimensional array fields, and the per field type resolution against the
+previous repr() parsing (ctype2stdc_helper with a repr string)
+
+usage:
+python benchmarks/bench_header.py [--structs 3000] [--fields 20] [--json results.json]
+"""
+import argparse
+import ctypes
+import io
+import json
+import time
+
+import synthetic  # noqa: F401, puts datagenDV on sys.path
+from datagenDV import ctypes_helper
+
+
+def make_structs(count, field_count):
+    field_types = [ctypes.c_uint64, ctypes.c_uint32 * 4, ctypes.c_uint8 * 16, ctypes.c_uint16 * 4 * 2]
+    fields = [(f'field_{i}', field_types[i % len(field_types)]) for i in range(field_count)]
+    return [type(f'Struct{i}', (ctypes.Structure,), {'_fields_': fields}) for i in range(count)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--structs', type=int, default=3000)
+    parser.add_argument('--fields', type=int, default=20)
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+    structs = make_structs(args.structs, args.fields)
+    results = {}
+
+    start = time.perf_counter()
+    ctypes_helper.write_ctype_structs(io.StringIO(), structs)
+    results['write_ctype_structs'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for struct in structs:
+        for name, field_type in struct._fields_:
+            ctypes_helper.ctype_stdc_decl(name, field_type)
+    results['resolve_type_objects'] = time.perf_counter() - start
+
+    #repr() parsing can't handle the 2D array fields, only resolve the others
+    start = time.perf_counter()
+    for struct in structs:
+        for name, field_type in struct._fields_:
+            if not (issubclass(field_type, ctypes.Array) and issubclass(field_type._type_, ctypes.Array)):
+                ctypes_helper.ctype2stdc_helper(name, repr(field_type))
+    results['resolve_repr_strings'] = time.perf_counter() - start
+
+    for name, elapsed in results.items():
+        print(f"{name:>22}: {elapsed:8.4f} s")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({'structs': args.structs, 'fields': args.fields, 'seconds': results}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
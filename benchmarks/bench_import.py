@@ -0,0 +1,88 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Import time benchmark of the datagenDV package
+Runs each flow in a fresh interpreter under python -X importtime and reports the
+cumulative import time and which heavy dependencies got loaded
+Exits non zero when a flow imports a dependency it should not, or exceeds --budget_ms
+
+usage:
+python benchmarks/bench_import.py [--repeat 5] [--budget_ms 100] [--json results.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ('vsc', 'ruamel.yaml', 'ctypes', 'numpy')
+
+YAML_CLASS = """
+import dataclasses
+@dataclasses.dataclass
+class Frame(dg.YAMLParamsBase):
+    width : int = dg.field(64)
+Frame()
+"""
+
+#flow -> (code, heavy modules it must not load)
+FLOWS = {
+    'import': ("import datagenDV as dg", HEAVY_MODULES),
+    'yaml_class': ("import datagenDV as dg" + YAML_CLASS, ('vsc', 'ruamel.yaml', 'numpy')),
+    'datagen_base': ("import datagenDV as dg\ndg.DatagenBase", ('vsc', 'numpy')),
+    'rand_field': ("import datagenDV as dg\ndg.rand_field", ()),
+}
+
+
+def import_times(code):
+    """Runs code under -X importtime. Returns (total import microseconds, top level modules loaded)"""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], cwd=ROOT,
+                            capture_output=True, text=True, check=True)
+    total = 0
+    modules = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        #Top level entries are not indented, their cumulative times add up to the total
+        if not name.startswith('  ', 1):
+            total += int(cumulative)
+        modules.add(name.strip())
+    return total, modules
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--repeat', type=int, default=5, help='runs per flow, the fastest is reported')
+    parser.add_argument('--budget_ms', type=float, default=None, help='fail if importing datagenDV takes longer')
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {}
+    failures = []
+    for flow, (code, forbidden) in FLOWS.items():
+        runs = [import_times(code) for _ in range(args.repeat)]
+        total, modules = min(runs, key=lambda run: run[0])
+        loaded = [module for module in HEAVY_MODULES if module in modules]
+        results[flow] = {'import_ms': total / 1000, 'heavy_modules': loaded}
+        print(f"{flow:>14}: {total / 1000:8.2f} ms  loads {', '.join(loaded) or '-'}")
+        for module in forbidden:
+            if module in loaded:
+                failures.append(f"{flow} imports {module}")
+    if args.budget_ms is not None and results['import']['import_ms'] > args.budget_ms:
+        failures.append(f"import datagenDV took {results['import']['import_ms']:.2f} ms, budget {args.budget_ms} ms")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    for failure in failures:
+        print(f"ERROR: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Memory per datagen object, measured with tracemalloc
+Compares a __dict__ based YAMLParamsBase dataclass against the same class declared with
+dataclass(slots=True), and rand_dataclass objects against their to_record() records
+
+usage:
+python benchmarks/bench_memory.py [--count 20000] [--json results.json]
+"""
+import argparse
+import gc
+import json
+import tracemalloc
+from dataclasses import dataclass
+
+from synthetic import RandDescriptor, MEM_REGIONS_E, dg
+
+
+@dataclass
+class DictDescriptor(dg.YAMLParamsBase):
+    ADDRESS  : int           = dg.field(0)
+    SIZE     : int           = dg.field(64)
+    FLAGS    : int           = dg.field(0)
+    REGION   : MEM_REGIONS_E = dg.field("RAM")
+
+
+@dataclass(slots=True)
+class SlotDescriptor(dg.YAMLParamsBase):
+    ADDRESS  : int           = dg.field(0)
+    SIZE     : int           = dg.field(64)
+    FLAGS    : int           = dg.field(0)
+    REGION   : MEM_REGIONS_E = dg.field("RAM")
+
+
+def bytes_per_object(make, count):
+    """Traced bytes still allocated per object after building count objects with make(index)"""
+    gc.collect()
+    tracemalloc.start()
+    objects = [make(index) for index in range(count)]
+    size = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(objects) == count
+    return size / count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=20000)
+    parser.add_argument('--rand_count', type=int, default=2000, help='rand_dataclass objects, slower to build')
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    kwargs = dict(SIZE=128, FLAGS=3, REGION="ROM")
+    rand_objects = [RandDescriptor() for _ in range(args.rand_count)]
+    for obj in rand_objects:
+        obj.randomize()
+    #Build the record class outside the traced region
+    rand_objects[0].to_record()
+
+    results = {
+        'dict_dataclass': bytes_per_object(lambda index: DictDescriptor(ADDRESS=index, **kwargs), args.count),
+        'slots_dataclass': bytes_per_object(lambda index: SlotDescriptor(ADDRESS=index, **kwargs), args.count),
+        'rand_dataclass': bytes_per_object(lambda index: RandDescriptor(), args.rand_count),
+        'rand_record': bytes_per_object(lambda index: rand_objects[index].to_record(), args.rand_count),
+    }
+    for name, size in results.items():
+        print(f"{name:>16}: {size:10.0f} bytes/object")
+    print(f"  slots saves {1 - results['slots_dataclass'] / results['dict_dataclass']:.0%} over __dict__, "
+          f"records are {results['rand_dataclass'] / results['rand_record']:.0f}x smaller than rand objects")
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({name: {'bytes_per_object': size} for name, size in results.items()}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+MemoryImage benchmark: Descriptor objects scattered over a multi-GB address space
+Places --count objects at random aligned addresses, with the segment list and with a sparse
+memory-mapped backing file, then exports the raw binary, Intel HEX and manifest
+Reports objects/s, traced python memory per populated byte and the disk blocks the files allocate
+
+usage:
+python benchmarks/bench_memory_image.py [--count 100000] [--space_gb 4] [--json results.json]
+"""
+import argparse
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from synthetic import Descriptor
+from datagenDV import ctypes_helper
+
+
+def allocated_bytes(filename):
+    """Disk space used by filename, its apparent size where st_blocks is not available"""
+    stat = os.stat(filename)
+    return stat.st_blocks * 512 if hasattr(stat, 'st_blocks') else stat.st_size
+
+
+def bench(objects, addresses, space, filename, directory):
+    results = {}
+    tracemalloc.start()
+    start = time.perf_counter()
+    image = ctypes_helper.MemoryImage(size=space, filename=filename)
+    for obj, address in zip(objects, addresses):
+        image.place(obj, address)
+    results['place_objects_per_s'] = len(objects) / (time.perf_counter() - start)
+    results['populated_bytes'] = image.populated_bytes()
+    results['traced_bytes_per_populated_byte'] = tracemalloc.get_traced_memory()[1] / results['populated_bytes']
+    tracemalloc.stop()
+
+    for export, extension in (('write_ihex', 'hex'), ('write_manifest', 'json'), ('write_binary', 'bin')):
+        output = os.path.join(directory, f"image.{extension}")
+        start = time.perf_counter()
+        getattr(image, export)(output)
+        results[f'{export}_s'] = time.perf_counter() - start
+        results[f'{export}_allocated_bytes'] = allocated_bytes(output)
+    image.close()
+    if filename is not None:
+        results['backing_file_allocated_bytes'] = allocated_bytes(filename)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--space_gb', type=float, default=4, help='size of the address space')
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    space = int(args.space_gb * (1 << 30))
+    record_size = ctypes_helper.ctype_obj_size(Descriptor)
+    slot = 1 << (record_size - 1).bit_length()
+    rng = random.Random(1)
+    addresses = sorted(rng.sample(range(space // slot), args.count))
+    addresses = [slot_index * slot for slot_index in addresses]
+    rng.shuffle(addresses)
+    objects = [Descriptor(ADDRESS=address, SIZE=64 + index % 512) for index, address in enumerate(addresses)]
+
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        results['segments'] = bench(objects, addresses, None, None, directory)
+        results['mmap'] = bench(objects, addresses, space, os.path.join(directory, 'backing.bin'), directory)
+
+    for mode, stats in results.items():
+        print(f"{mode:>9}: place {stats['place_objects_per_s']:9.0f} obj/s  "
+              f"{stats['traced_bytes_per_populated_byte']:5.1f} traced bytes/populated byte  "
+              f"raw binary {stats['write_binary_allocated_bytes'] / (1 << 20):7.1f} MB on disk for "
+              f"{args.space_gb:g} GB  ihex {stats['write_ihex_s']:.2f} s")
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,205 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Full datagen pipeline benchmark over object shapes and suite sizes
+Each (shape, size) runs in a fresh interpreter so peak RSS is its own. Stages:
+  parse_yaml              DatagenBase.parse_yaml of the synthetic suite (YAML load and object construction)
+  construct               constructing the objects again from keyword arguments (__post_init__ validation)
+  randomize               DatagenBase.randomize_all, rand shapes only
+  write_yaml              DatagenBase.write_outputs, the to_yaml dump of the suite
+  write_ctype_structs     the C struct definitions of the shape's classes
+  write_ctype_obj_binary  one binary file per object, for the first --file_limit objects
+  write_ctype_objs        every object into one binary file
+Shapes: flat (Descriptor), wide (Wide<--width> register map), nested (Packet with a Descriptor
+header and lists) and rand (RandDescriptor, sizes above --rand_limit are skipped)
+Results are JSON with objects/s and peak RSS per stage. --compare reports the throughput change
+against the JSON of a previous run, e.g. of another commit, and exits 1 on a regression
+YAML parsing holds the whole composed document, so 1M object suites need tens of GB with the rt engine.
+Run them with --yaml_engine fast and a single shape
+
+usage:
+python benchmarks/bench_pipeline.py [--sizes 1 100 10000] [--shapes flat wide nested rand]
+                                    [--json results.json] [--compare baseline.json]
+python benchmarks/bench_pipeline.py --sizes 1 1000 1000000 --shapes flat --yaml_engine fast --json results.json
+"""
+import argparse
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.abspath(__file__)
+ROOT = os.path.dirname(os.path.dirname(SCRIPT))
+
+SHAPES = ('flat', 'wide', 'nested', 'rand')
+
+
+def shape_classes(shape, width):
+    """(class of the suite objects, classes to register, entry(index) YAML generator, kwargs(index) for construct)"""
+    import synthetic
+    if shape == 'flat':
+        return (synthetic.Descriptor, [synthetic.Descriptor], synthetic.descriptor_yaml,
+                lambda index: dict(ADDRESS=index, SIZE=64, FLAGS=index % 7, REGION="ROM", REGIONS=["ROM", "CD"]))
+    if shape == 'wide':
+        cls = synthetic.wide_class(width)
+        return (cls, [cls], synthetic.wide_yaml(width),
+                lambda index: {f'REG_{reg}': index + reg for reg in range(width)})
+    if shape == 'nested':
+        header = synthetic.Descriptor(ADDRESS=0x1000_0000, SIZE=64)
+        return (synthetic.Packet, [synthetic.Packet, synthetic.Descriptor], synthetic.packet_yaml,
+                lambda index: dict(HEADER=header, PAYLOAD=list(range(synthetic.PAYLOAD_WORDS)), ROUTE=["ROM", "RAM"]))
+    return (synthetic.RandDescriptor, [synthetic.RandDescriptor], synthetic.rand_descriptor_yaml,
+            lambda index: dict(SIZE=64) if index % 4 == 0 else {})
+
+
+def run_worker(shape, size, width, engine, jobs, file_limit):
+    """Runs the pipeline of one (shape, size) in this process. Returns {stage: stats}"""
+    import synthetic
+    from synthetic import dg
+    from datagenDV import ctypes_helper
+    from datagenDV.profiler import peak_rss_kb
+
+    cls, classes, entry, kwargs = shape_classes(shape, width)
+
+    class PipelineDatagen(dg.DatagenBase):
+        def setup(self):
+            pass
+
+        def clean(self):
+            pass
+
+    stages = {}
+    def timed(name, count, function):
+        start = time.perf_counter()
+        function()
+        seconds = time.perf_counter() - start
+        stages[name] = {'objects': count, 'seconds': seconds,
+                        'objects_per_s': count / seconds if seconds else None, 'peak_rss_kb': peak_rss_kb()}
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_yaml = os.path.join(directory, 'suite.yaml')
+        with open(input_yaml, 'w') as fh:
+            fh.write(synthetic.objects_yaml(entry, size))
+        sys.argv = [SCRIPT, input_yaml, os.path.join(directory, 'out.yaml'), '--header_path', directory,
+                    '--seed', '1', '--yaml_engine', engine, '--jobs', str(jobs), '--no_cache']
+        datagen = PipelineDatagen()
+        for klass in classes:
+            datagen.yaml.register_class(klass)
+        stages['setup'] = {'objects': 0, 'seconds': 0.0, 'objects_per_s': None, 'peak_rss_kb': peak_rss_kb()}
+
+        timed('parse_yaml', size, datagen.parse_yaml)
+        objects = [obj for _, obj in dg.iter_objects(datagen.yaml_dict) if type(obj) is cls]
+        assert len(objects) == size, f"{len(objects)} {cls.__name__} objects parsed, expected {size}"
+
+        timed('construct', size, lambda: [cls(**kwargs(index)) for index in range(size)])
+        if shape == 'rand':
+            timed('randomize', size, datagen.randomize_all)
+        timed('write_yaml', size, datagen.write_outputs)
+        timed('write_ctype_structs', len(classes),
+              lambda: ctypes_helper.write_ctype_structs(io.StringIO(), classes, use_hfields=True))
+        binary_dir = os.path.join(directory, 'bin')
+        os.mkdir(binary_dir)
+        files = min(size, file_limit)
+        timed('write_ctype_obj_binary', files,
+              lambda: [ctypes_helper.write_ctype_obj_binary(objects[index], os.path.join(binary_dir, f'{index}.bin'))
+                       for index in range(files)])
+        def write_objs():
+            with open(os.path.join(directory, 'objects.bin'), 'wb') as fh:
+                ctypes_helper.write_ctype_objs(objects, fh)
+        timed('write_ctype_objs', size, write_objs)
+    return stages
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=ROOT, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_file, tolerance):
+    """Prints the objects/s ratio of every stage also in baseline_file. Returns the regressions"""
+    with open(baseline_file) as fh:
+        baseline = {(run['shape'], run['size']): run['stages'] for run in json.load(fh)['runs']}
+    regressions = []
+    print(f"\nobjects/s against {baseline_file}")
+    for run in results['runs']:
+        base_stages = baseline.get((run['shape'], run['size']))
+        if base_stages is None:
+            continue
+        for stage, stats in run['stages'].items():
+            base = base_stages.get(stage)
+            if base is None or not base['objects_per_s'] or not stats['objects_per_s']:
+                continue
+            ratio = stats['objects_per_s'] / base['objects_per_s']
+            flag = ''
+            if ratio < 1 - tolerance:
+                flag = '  REGRESSION'
+                regressions.append(f"{run['shape']} {run['size']} {stage} at {ratio:.2f}x")
+            print(f"{run['shape']:>7} {run['size']:>8} {stage:>22} {ratio:8.2f}x{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1, 100, 10000])
+    parser.add_argument('--shapes', type=str, nargs='+', choices=SHAPES, default=list(SHAPES))
+    parser.add_argument('--width', type=int, default=64, help='fields of the wide shape')
+    parser.add_argument('--yaml_engine', type=str, choices=('rt', 'fast'), default='rt')
+    parser.add_argument('--jobs', type=int, default=1, help='randomize_all worker processes')
+    parser.add_argument('--rand_limit', type=int, default=10000, help='largest size run for the rand shape')
+    parser.add_argument('--file_limit', type=int, default=10000, help='most files written by write_ctype_obj_binary')
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    parser.add_argument('--compare', type=str, default=None, help='JSON of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='--compare: throughput drop reported as a regression')
+    parser.add_argument('--worker', type=str, nargs=2, metavar=('SHAPE', 'SIZE'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        stages = run_worker(args.worker[0], int(args.worker[1]), args.width, args.yaml_engine, args.jobs, args.file_limit)
+        print(json.dumps(stages))
+        return
+
+    results = {
+        'commit': git_commit(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'config': {'width': args.width, 'yaml_engine': args.yaml_engine, 'jobs': args.jobs, 'file_limit': args.file_limit},
+        'runs': [],
+    }
+    print(f"{'shape':>7} {'size':>8} {'stage':>22} {'seconds':>9} {'objects/s':>11} {'peak MB':>8}")
+    for shape in args.shapes:
+        for size in args.sizes:
+            if shape == 'rand' and size > args.rand_limit:
+                continue
+            worker = subprocess.run([sys.executable, SCRIPT, '--worker', shape, str(size), '--width', str(args.width),
+                                     '--yaml_engine', args.yaml_engine, '--jobs', str(args.jobs),
+                                     '--file_limit', str(args.file_limit)],
+                                    capture_output=True, text=True, check=True)
+            stages = json.loads(worker.stdout.splitlines()[-1])
+            results['runs'].append({'shape': shape, 'size': size, 'stages': stages})
+            for stage, stats in stages.items():
+                if stage == 'setup':
+                    continue
+                rate = f"{stats['objects_per_s']:11.0f}" if stats['objects_per_s'] else f"{'-':>11}"
+                peak = f"{stats['peak_rss_kb'] / 1024:8.1f}" if stats['peak_rss_kb'] is not None else f"{'-':>8}"
+                print(f"{shape:>7} {size:>8} {stage:>22} {stats['seconds']:9.3f} {rate} {peak}")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+    regressions = compare(results, args.compare, args.tolerance) if args.compare else []
+    for regression in regressions:
+        print(f"ERROR: {regression}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == '__main__':
+    main()
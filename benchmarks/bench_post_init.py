@@ -0,0 +1,77 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Microbenchmark for ParamsBase.__post_init__
+Compares the per class validation plans against the previous per field
+dataclasses.fields()/vars() implementation, and against skip_validation()
+
+usage:
+python benchmarks/bench_post_init.py [--count 100000] [--json results.json]
+"""
+import argparse
+import dataclasses
+import json
+import time
+from enum import Enum
+
+from synthetic import Descriptor, dg
+from datagenDV.ctypes_helper import ctype2python
+
+
+def legacy_post_init(self):
+    """ParamsBase.__post_init__ before validation plans, kept as the reference"""
+    if not dataclasses.is_dataclass(self):
+        return
+    for field in dataclasses.fields(self):
+        if field.name not in vars(self):
+            setattr(self, field.name, getattr(self, field.name))
+        if field.type is Ellipsis:
+            continue
+        value = getattr(self, field.name)
+        if issubclass(field.type, Enum) and isinstance(value,str):
+            setattr(self, field.name, field.type[value])
+        elif not isinstance(value, field.type) and value is not None:
+            if field.type in ctype2python:
+                if not isinstance(value,ctype2python[field.type]):
+                    raise ValueError(f'{type(self)} : Expected {field.name} with ctype {field.type} to be {ctype2python[field.type]}, '
+                                f'got {type(value)}')
+            else:
+                raise ValueError(f'{type(self)} : Expected {field.name} to be {field.type}, '
+                                f'got {type(value)}')
+
+
+def construct(count):
+    kwargs = dict(ADDRESS=0x1000, SIZE=128, FLAGS=3, REGION="ROM", REGIONS=["RAM"], COMMENT="bench")
+    start = time.perf_counter()
+    for _ in range(count):
+        Descriptor(**kwargs)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=100000)
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {}
+    plan_post_init = Descriptor.__post_init__
+    Descriptor.__post_init__ = legacy_post_init
+    results['legacy'] = construct(args.count)
+    Descriptor.__post_init__ = plan_post_init
+    results['plan'] = construct(args.count)
+    with dg.skip_validation():
+        results['skip_validation'] = construct(args.count)
+
+    for name, elapsed in results.items():
+        print(f"{name:>16}: {elapsed / args.count * 1e6:7.2f} us/object  {results['legacy'] / elapsed:5.2f}x")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({'count': args.count, 'seconds': results}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
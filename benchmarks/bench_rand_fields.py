@@ -0,0 +1,111 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Scaling of the rand_YML_override hooks with the number of rand fields
+Compares yaml_input_constraints and post_randomize driven by the per class rand_field_table()
+against the previous implementation, which scanned vars() for rand_ names and looked up
+each field type in dataclasses.fields() (quadratic in the field count)
+Constraints are elaborated when a pyvsc object builds its model on construction, so that cost is timed with construction
+
+usage:
+python benchmarks/bench_rand_fields.py [--fields 10 50 200 400] [--objects 20] [--json results.json]
+"""
+import argparse
+import dataclasses
+import json
+import time
+
+import vsc
+from synthetic import dg
+from datagenDV import rand_params_base
+
+
+def legacy_rand_YML_override(cls):
+    """rand_YML_override before rand_field_table, kept as the reference"""
+
+    @vsc.constraint
+    def yaml_input_constraints(self):
+        for rand_field_name in [field_name for field_name in vars(self).keys() if field_name.startswith('rand_')]:
+            rand_field = getattr(self, rand_field_name)
+            non_rand_field = getattr(self, rand_field_name.split('rand_')[1])
+            if non_rand_field is not None:
+                rand_field == non_rand_field
+
+    def post_randomize(self):
+        assert(dataclasses.is_dataclass(self))
+        for rand_field_name in [field_name for field_name in vars(self).keys() if field_name.startswith('rand_')]:
+            non_rand_name = rand_field_name.split('rand_')[1]
+            assert non_rand_name in vars(self).keys()
+            non_rand_field_val = getattr(self, non_rand_name)
+            if non_rand_field_val is None:
+                rand_field_val = getattr(self, rand_field_name)
+                non_rand_type = [field.type for field in dataclasses.fields(self) if field.name == non_rand_name][0]
+                setattr(self, non_rand_name, non_rand_type(rand_field_val))
+
+    setattr(cls, 'yaml_input_constraints', yaml_input_constraints)
+    setattr(cls, 'post_randomize', post_randomize)
+    return cls
+
+
+def wide_class(fields, legacy):
+    """rand_dataclass with fields rand fields REG_<i>"""
+    namespace = {'__annotations__': {}}
+    for index in range(fields):
+        namespace['__annotations__'][f'REG_{index}'] = int
+        namespace[f'REG_{index}'] = dg.rand_field(vsc.rand_bit_t, 32)
+    cls = type(f'Wide{fields}', (dg.YAMLParamsBase,), namespace)
+    if not legacy:
+        return dg.rand_dataclass(cls)
+    override = rand_params_base.rand_YML_override
+    rand_params_base.rand_YML_override = legacy_rand_YML_override
+    try:
+        return dg.rand_dataclass(cls)
+    finally:
+        rand_params_base.rand_YML_override = override
+
+
+def bench(cls, fields, objects, repeat):
+    """Seconds per object of construction and of post_randomize(), with every other field pinned from the input"""
+    pinned = {f'REG_{index}': index for index in range(1, fields, 2)}
+    start = time.perf_counter()
+    instances = [cls(**pinned) for _ in range(objects)]
+    construct_seconds = (time.perf_counter() - start) / objects
+
+    unpinned = [f'REG_{index}' for index in range(0, fields, 2)]
+    post_seconds = 0.0
+    for _ in range(repeat):
+        for obj in instances:
+            for name in unpinned:
+                setattr(obj, name, None)
+        start = time.perf_counter()
+        for obj in instances:
+            obj.post_randomize()
+        post_seconds += time.perf_counter() - start
+    return construct_seconds, post_seconds / (objects * repeat)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--fields', type=int, nargs='+', default=[10, 50, 200, 400])
+    parser.add_argument('--objects', type=int, default=20)
+    parser.add_argument('--repeat', type=int, default=20, help='post_randomize calls per object')
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'fields':>6} {'impl':>7} {'construct us/field':>19} {'post_randomize us/field':>24}")
+    for fields in args.fields:
+        for impl in ('legacy', 'table'):
+            construct_seconds, post_seconds = bench(wide_class(fields, impl == 'legacy'), fields, args.objects, args.repeat)
+            results.setdefault(str(fields), {})[impl] = {'construct_us': construct_seconds * 1e6,
+                                                          'post_randomize_us': post_seconds * 1e6}
+            print(f"{fields:>6} {impl:>7} {construct_seconds * 1e6 / fields:19.2f} {post_seconds * 1e6 / fields:24.3f}")
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Benchmark for randomize_many
+Compares per object randomize() calls against randomize_many returning
+instances and returning a numpy structured array
+
+usage:
+python benchmarks/bench_randomize_many.py [--count 1000] [--array_count 1000000] [--json results.json]
+"""
+import argparse
+import json
+import time
+
+from synthetic import RandDescriptor, dg
+
+
+def per_object(count):
+    start = time.perf_counter()
+    for _ in range(count):
+        RandDescriptor().randomize()
+    return time.perf_counter() - start
+
+
+def bulk(count, as_array):
+    start = time.perf_counter()
+    dg.randomize_many(RandDescriptor, count, seed=1, as_array=as_array)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=1000, help='objects for the per object and instance runs')
+    parser.add_argument('--array_count', type=int, default=1000000, help='objects for the structured array run')
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {
+        'randomize': (args.count, per_object(args.count)),
+        'randomize_many': (args.count, bulk(args.count, as_array=False)),
+        'randomize_many_array': (args.array_count, bulk(args.array_count, as_array=True)),
+    }
+    baseline = results['randomize'][1] / results['randomize'][0]
+    for name, (count, elapsed) in results.items():
+        per_obj = elapsed / count
+        print(f"{name:>20}: {count:>8} objects {elapsed:8.3f} s {per_obj * 1e6:10.2f} us/object  {baseline / per_obj:9.1f}x")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump({name: {'count': count, 'seconds': elapsed} for name, (count, elapsed) in results.items()}, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
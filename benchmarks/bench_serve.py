@@ -0,0 +1,115 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Per test latency of DatagenBase: one interpreter per test against --serve requests
+The datagen script is this file started with --datagen. Each test loads a small suite,
+randomizes a RandDescriptor and writes the output YAML and datagen_types.h
+
+usage:
+python benchmarks/bench_serve.py [--tests 20] [--descriptors 10] [--json results.json]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT = os.path.abspath(__file__)
+
+
+def run_datagen():
+    from synthetic import Descriptor, RandDescriptor, MEM_REGIONS_E, dg
+
+    class SyntheticDatagen(dg.DatagenBase):
+        def setup(self):
+            pass
+
+        def clean(self):
+            pass
+
+        def __init__(self):
+            super().__init__(description="bench_serve synthetic datagen")
+            self.yaml.register_class(Descriptor)
+            self.yaml.register_class(RandDescriptor)
+            self.parse_yaml()
+
+        def main(self):
+            self.yaml_dict['suite']['rand'].randomize()
+            self.write_outputs(structs=[Descriptor], enums=[MEM_REGIONS_E])
+
+    SyntheticDatagen().run()
+
+
+def suite_file(directory, descriptors):
+    from synthetic import suite_yaml
+    filename = os.path.join(directory, 'suite.yaml')
+    with open(filename, 'w') as fh:
+        fh.write(suite_yaml(descriptors) + "  rand:\n    DatagenClass: RandDescriptor\n")
+    return filename
+
+
+def bench_cold(input_yaml, directory, tests):
+    start = time.perf_counter()
+    for index in range(tests):
+        subprocess.run([sys.executable, SCRIPT, '--datagen', input_yaml, os.path.join(directory, f'cold_{index}.yaml'),
+                        '--seed', str(index), '--header_path', directory, '--no_cache'], check=True, stdout=subprocess.DEVNULL)
+    return (time.perf_counter() - start) / tests
+
+
+def bench_serve(input_yaml, directory, tests, jobs):
+    """Average request round trip once the server answered a first ping"""
+    server = subprocess.Popen([sys.executable, SCRIPT, '--datagen', '--serve', '--jobs', str(jobs), '--no_cache'],
+                              stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, text=True)
+    def request(message):
+        server.stdin.write(json.dumps(message) + "\n")
+        server.stdin.flush()
+        response = json.loads(server.stdout.readline())
+        assert response['ok'], response
+        return response
+
+    request({'cmd': 'ping'})
+    start = time.perf_counter()
+    for index in range(tests):
+        request({'id': index, 'input_yaml': input_yaml, 'output_yaml': os.path.join(directory, f'serve_{index}.yaml'),
+                 'seed': index, 'header_path': directory})
+    latency = (time.perf_counter() - start) / tests
+    server.stdin.close()
+    server.wait()
+    return latency
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--tests', type=int, default=20)
+    parser.add_argument('--descriptors', type=int, default=10, help='Descriptor objects in the input suite')
+    parser.add_argument('--jobs', type=int, default=1, help='--serve worker processes')
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        input_yaml = suite_file(directory, args.descriptors)
+        results = {
+            'cold_process_ms': bench_cold(input_yaml, directory, args.tests) * 1000,
+            'serve_request_ms': bench_serve(input_yaml, directory, args.tests, args.jobs) * 1000,
+        }
+        for index in range(args.tests):
+            with open(os.path.join(directory, f'cold_{index}.yaml')) as cold, open(os.path.join(directory, f'serve_{index}.yaml')) as warm:
+                assert cold.read() == warm.read(), f"test {index} differs between a fresh process and --serve"
+
+    print(f"  fresh process: {results['cold_process_ms']:8.1f} ms/test")
+    print(f"  --serve      : {results['serve_request_ms']:8.1f} ms/test  {results['cold_process_ms'] / results['serve_request_ms']:.1f}x")
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    if sys.argv[1:2] == ['--datagen']:
+        del sys.argv[1]
+        run_datagen()
+    else:
+        main()
@@ -0,0 +1,92 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Benchmark and self-check of the rand_dataclass solver cache (enable_solver_cache)
+Randomizes the same seeded objects uncached and cached and asserts identical values, for
+default objects, objects with a field's rand_mode off and objects with a constraint_mode off.
+The cached model is shared per pinned values, so objects with changed modes must solve uncached
+
+usage:
+python benchmarks/bench_solver_cache.py [--count 200] [--json results.json]
+"""
+import argparse
+import json
+import time
+
+import vsc
+from vsc.model.rand_state import RandState
+from synthetic import dg
+
+
+@dg.rand_dataclass
+class Pair(dg.YAMLParamsBase):
+    A : int = dg.rand_field(vsc.rand_bit_t, 16)
+    B : int = dg.rand_field(vsc.rand_bit_t, 16)
+    C : int = dg.rand_field(vsc.rand_bit_t, 8)
+    D : int = dg.rand_field(vsc.rand_bit_t, 8)
+
+    @vsc.constraint
+    def order_c(self):
+        self.rand_A < self.rand_B
+
+
+def rand_mode_off(obj):
+    obj.rand_A = 5
+    with vsc.raw_mode():
+        obj.rand_A.rand_mode = False
+
+
+def constraint_mode_off(obj):
+    obj.order_c.constraint_mode(False)
+
+
+CASES = {'default': None, 'rand_mode_off': rand_mode_off, 'constraint_mode_off': constraint_mode_off}
+
+
+def run(count, setup, cached):
+    """Seconds and (A, B, C, D) of count objects with C and D pinned, seeded per index"""
+    dg.enable_solver_cache(cached)
+    values = []
+    start = time.perf_counter()
+    for index in range(count):
+        obj = Pair(C=1, D=2)
+        if setup is not None:
+            setup(obj)
+        obj.set_randstate(RandState.mkFromSeed(1, str(index)))
+        obj.randomize()
+        values.append((obj.A, obj.B, obj.C, obj.D))
+    seconds = time.perf_counter() - start
+    info = dg.solver_cache_info()
+    dg.enable_solver_cache(False)
+    return seconds, values, info
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--count', type=int, default=200)
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = {}
+    print(f"{'case':>20} {'uncached s':>11} {'cached s':>9} {'hits':>6} {'misses':>7}")
+    for name, setup in CASES.items():
+        uncached_seconds, uncached, _ = run(args.count, setup, False)
+        cached_seconds, cached, info = run(args.count, setup, True)
+        assert cached == uncached, f"{name}: cached randomize() differs from uncached"
+        if name == 'rand_mode_off':
+            assert {a for a, _, _, _ in cached} == {5}, "rand_mode_off: A was randomized"
+        if name == 'constraint_mode_off':
+            assert {a < b for a, b, _, _ in cached} == {False, True}, "constraint_mode_off: A < B still applied"
+        results[name] = {'count': args.count, 'uncached_seconds': uncached_seconds, 'cached_seconds': cached_seconds,
+                         'hits': info.hits, 'misses': info.misses}
+        print(f"{name:>20} {uncached_seconds:11.3f} {cached_seconds:9.3f} {info.hits:6} {info.misses:7}")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
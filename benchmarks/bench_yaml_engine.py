@@ -0,0 +1,57 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Compares the round-trip and fast (C libyaml) YAML engines of DatagenBase
+Loads and dumps synthetic suites of Descriptor objects
+
+usage:
+python benchmarks/bench_yaml_engine.py [--sizes 1000 10000 100000] [--json results.json]
+"""
+import argparse
+import io
+import json
+import time
+
+from synthetic import Descriptor, suite_yaml, dg
+
+
+def bench_engine(engine, yaml_text):
+    yaml = dg.create_yaml(engine)
+    yaml.register_class(Descriptor)
+    transform = None if engine == 'fast' else (lambda s: s.replace('!', ''))
+
+    start = time.perf_counter()
+    yaml_dict = yaml.load(yaml_text)
+    load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    yaml.dump(yaml_dict, io.StringIO(), transform=transform)
+    dump_time = time.perf_counter() - start
+    return load_time, dump_time
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--json', type=str, default=None, help='write results as JSON to this file')
+    args = parser.parse_args()
+
+    results = []
+    print(f"{'objects':>8} {'engine':>6} {'load s':>8} {'dump s':>8} {'obj/s':>10}")
+    for size in args.sizes:
+        yaml_text = suite_yaml(size)
+        for engine in dg.YAML_ENGINES:
+            load_time, dump_time = bench_engine(engine, yaml_text)
+            rate = size / (load_time + dump_time)
+            results.append({'objects': size, 'engine': engine, 'load_s': load_time, 'dump_s': dump_time, 'objects_per_s': rate})
+            print(f"{size:>8} {engine:>6} {load_time:>8.3f} {dump_time:>8.3f} {rate:>10.0f}")
+
+    if args.json:
+        with open(args.json, 'w') as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == '__main__':
+    main()
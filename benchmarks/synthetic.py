@@ -0,0 +1,121 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Synthetic datagen classes and YAML suites for the benchmarks
+"""
+import os, sys
+import ctypes
+from dataclasses import dataclass
+from enum import IntEnum
+import vsc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import datagenDV as dg
+
+
+class MEM_REGIONS_E(IntEnum):
+    ROM = 1
+    RAM = 2
+    CD = 3
+    FLOPPY = 4
+    MAGNET_TAPE = 5
+
+MAX_REGIONS = 4
+
+@dataclass
+class Descriptor(dg.YAMLParamsBase, ctypes.Structure):
+    ADDRESS  : ctypes.c_uint64 = dg.field(0)
+    SIZE     : ctypes.c_uint32 = dg.field(64)
+    FLAGS    : ctypes.c_uint32 = dg.field(0)
+    REGION   : MEM_REGIONS_E   = dg.field("RAM")
+    REGIONS  : list            = dg.field(lambda:["ROM", "RAM"])
+    COMMENT  : str             = dg.field(None, dir='in')
+
+Descriptor.generate_hfields({'REGIONS': (MEM_REGIONS_E, MAX_REGIONS)})
+
+
+@dg.rand_dataclass
+class RandDescriptor(dg.YAMLParamsBase):
+    ADDRESS  : int           = dg.rand_field(vsc.rand_bit_t, 64)
+    SIZE     : int           = dg.rand_field(vsc.rand_bit_t, 32)
+    FLAGS    : int           = dg.rand_field(vsc.rand_bit_t, 8)
+    REGION   : MEM_REGIONS_E = dg.rand_field(vsc.rand_enum_t, MEM_REGIONS_E)
+
+    @vsc.constraint
+    def descriptor_c(self):
+        self.rand_ADDRESS.inside(vsc.rangelist((0x1000_0000, 0x1FFF_FFFF), (0x8000_0000, 0x8FFF_FFFF)))
+        self.rand_SIZE >= 64
+        self.rand_SIZE <= 4096
+        vsc.dist(self.rand_FLAGS, [vsc.weight(0, 10), vsc.weight((1, 6), 30)])
+
+RandDescriptor.generate_hfields()
+
+PAYLOAD_WORDS = 16
+
+@dataclass
+class Packet(dg.YAMLParamsBase):
+    """Nested struct: a Descriptor header plus fixed size lists"""
+    HEADER   : Descriptor    = dg.field(None)
+    PAYLOAD  : list          = dg.field(lambda:[])
+    ROUTE    : list          = dg.field(lambda:[])
+
+Packet.generate_hfields({'PAYLOAD': (ctypes.c_uint32, PAYLOAD_WORDS), 'ROUTE': (MEM_REGIONS_E, MAX_REGIONS)})
+
+_wide_classes = {}
+
+def wide_class(width):
+    """Register map like class Wide<width> with width c_uint32 fields REG_<i>, built once per width"""
+    cls = _wide_classes.get(width)
+    if cls is None:
+        namespace = {'__annotations__': {f'REG_{index}': ctypes.c_uint32 for index in range(width)}}
+        namespace.update({f'REG_{index}': dg.field(0) for index in range(width)})
+        cls = _wide_classes[width] = dataclass(type(f'Wide{width}', (dg.YAMLParamsBase,), namespace))
+        cls.generate_hfields()
+    return cls
+
+
+def descriptor_yaml(index):
+    """One Descriptor entry of a suite"""
+    return (f"  - DatagenClass: Descriptor\n"
+            f"    ADDRESS: {0x1000_0000 + index * 64}\n"
+            f"    SIZE: {64 + index % 512}\n"
+            f"    FLAGS: {index % 7}\n"
+            f"    REGION: {MEM_REGIONS_E(1 + index % len(MEM_REGIONS_E)).name}\n"
+            f"    REGIONS: [ROM, CD]\n"
+            f"    COMMENT: descriptor {index}\n")
+
+
+def rand_descriptor_yaml(index):
+    """One RandDescriptor entry of a suite, every fourth one pins its SIZE"""
+    return "  - DatagenClass: RandDescriptor\n" + (f"    SIZE: {64 + index % 512}\n" if index % 4 == 0 else "")
+
+
+def packet_yaml(index):
+    """One Packet entry of a suite with a nested Descriptor header"""
+    payload = ", ".join(str((index + word) & 0xFFFF_FFFF) for word in range(PAYLOAD_WORDS))
+    return (f"  - DatagenClass: Packet\n"
+            f"    HEADER:\n"
+            f"      DatagenClass: Descriptor\n"
+            f"      ADDRESS: {0x1000_0000 + index * 64}\n"
+            f"      SIZE: {64 + index % 512}\n"
+            f"    PAYLOAD: [{payload}]\n"
+            f"    ROUTE: [ROM, {MEM_REGIONS_E(1 + index % len(MEM_REGIONS_E)).name}]\n")
+
+
+def wide_yaml(width):
+    """Returns the entry function of Wide<width> objects"""
+    def entry(index):
+        return f"  - DatagenClass: Wide{width}\n" + "".join(f"    REG_{reg}: {index + reg}\n" for reg in range(width))
+    return entry
+
+
+def suite_yaml(count):
+    """Suite text with count Descriptor objects under descriptors:"""
+    return "suite:\n  name: synthetic\n  descriptors:\n" + "".join(descriptor_yaml(i) for i in range(count))
+
+
+def objects_yaml(entry, count):
+    """Suite text with count objects from entry(index) under objects:"""
+    return "suite:\n  name: synthetic\n  objects:\n" + "".join(entry(i) for i in range(count))
@@ -1,5 +1,61 @@
-from .params_base import *
-from .rand_params_base import *
-from .yaml_params_base import *
-from .datagen_base import *
-from . import ctypes_helper
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Public names are loaded lazily on first access (PEP 562), so YAML-only or header-only flows
+do not pay for importing pyvsc (rand_params_base) or ruamel (datagen_base)
+"""
+import importlib
+
+#Public name -> submodule defining it
+_lazy_names = {
+    'params_base': ('ParamsBase', 'skip_validation', 'seed_object', 'field_items', 'ValidationPlan'),
+    'ctypes_helper': ('python2ctype', 'ctype2python', 'clear_ctype_class_cache'),
+    'rand_params_base': ('rand_field', 'rand_field_seperate', 'rand_dataclass', 'rand_dataclass_seperate',
+                         'rand_YML_override', 'SolverCacheInfo', 'enable_solver_cache', 'clear_solver_cache',
+                         'solver_cache_info', 'randomize_many', 'record_class', 'to_record',
+                         'rand_field_table'),
+    'yaml_params_base': ('field', 'yml_field', 'out_only_field', 'in_only_field', 'check_immutable',
+                         'convert_enum', 'yml_dump_excluded', 'YAMLParamsBase'),
+    'datagen_base': ('DatagenBase', 'YAML_ENGINES', 'create_yaml', 'derive_seed', 'iter_objects', 'seed_objects',
+                     'randomized_fields', 'merge_randomized_fields', 'file_sha256',
+                     'read_manifest', 'write_file_atomic', 'DatagenConstructor', 'DatagenRepresenter',
+                     'DatagenRoundTripRepresenter'),
+}
+#Modules and names the submodules import, re-exported as the eager star imports of earlier releases did
+_reexported_names = {
+    'rand_params_base': ('vsc', 'constraint', 'copy'),
+    'yaml_params_base': ('Enum', 'dataclasses', 'traceback'),
+    'datagen_base': ('YAML', 'MappingNode', 'SafeConstructor', 'argparse', 'os', 'random', 're', 'shutil', 'sys'),
+    'dataclasses': ('dataclass',),
+    'enum': ('IntEnum',),
+    'copy': ('deepcopy',),
+    'ruamel.yaml.comments': ('CommentedMap',),
+}
+_submodules = ('params_base', 'ctypes_helper', 'rand_params_base', 'yaml_params_base', 'datagen_base', 'profiler',
+               'output_cache')
+
+_name_to_module = {name: module for names_map in (_reexported_names, _lazy_names)
+                   for module, names in names_map.items() for name in names}
+
+__all__ = [name for names in _lazy_names.values() for name in names] + \
+          [name for names in _reexported_names.values() for name in names] + \
+          ['ctypes_helper', 'params_base', 'rand_params_base', 'yaml_params_base', 'datagen_base']
+
+
+def __getattr__(name):
+    module = _name_to_module.get(name)
+    if module is not None:
+        value = getattr(importlib.import_module(f'{__name__}.{module}' if module in _submodules else module), name)
+    elif name in _submodules:
+        value = importlib.import_module(f'{__name__}.{name}')
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    #Cache in the package namespace, __getattr__ is only called for missing names
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__) | set(_submodules))
@@ -12,10 +12,18 @@
 ######################################################
 
 import re
+import bisect
 import ctypes
 import collections
+import hashlib
+import itertools
+import json
+import mmap
+import os
 from enum import Enum, EnumMeta
 import dataclasses
+import struct
+from datagenDV import profiler
 
 
 #                             (ctype,            std C type,   python type, python->ctype default lookup )
@@ -52,7 +60,40 @@ ctype2python    = { x[0]:x[2] for x in ctype_stdc_python_lookup }
 
 
 
+#std C type by ctype. Aliased ctypes (c_uint64 is c_ulong on LP64) take the last entry, like ctype2stdc
+ctype2stdc_type = { x[0]:x[1] for x in ctype_stdc_python_lookup }
+
+#(std C type, array dimensions) by ctype, filled by ctype_stdc_decl
+_stdc_decl_cache = {}
+
+def ctype_stdc_decl(var, ctype):
+    """
+    Returns (std C type, declarator) for a variable of the given ctype, e.g.
+    ('unsigned int', 'var[3][4]') for ctypes.c_uint * 4 * 3
+    Resolved from the type objects (_type_/_length_ for arrays) and memoized per type
+    Structs and other non-basic types use their class name
+    """
+    cached = _stdc_decl_cache.get(ctype)
+    if cached is None:
+        dims = ""
+        base = ctype
+        while isinstance(base, type) and issubclass(base, ctypes.Array):
+            dims += '[%d]' % base._length_
+            base = base._type_
+        if base in ctype2stdc_type:
+            stdc = ctype2stdc_type[base]
+        else:
+            # Assume this is C/C++ struct or typedef
+            stdc = base.__name__
+        cached = _stdc_decl_cache[ctype] = (stdc, dims)
+    return cached[0], var + cached[1]
+
+
 def ctype2stdc_helper(var, klass):
+    """klass is a ctypes type, or (deprecated) its repr() string"""
+    if not isinstance(klass, str):
+        return ctype_stdc_decl(var, klass)
+
     stdc = "";
     inst = var;
 
@@ -71,11 +112,59 @@ def ctype2stdc_helper(var, klass):
     return stdc, inst;
 
 
+def _struct_dependencies(klass, use_hfields):
+    """
+    Struct classes used by the fields of klass, directly or as array elements
+    Nested datagen classes count whether or not they subclass ctypes.Structure. They are resolved
+    through get_ctype_class(), which checks their layout, and keep their own name in the header
+    """
+    deps = []
+    for f in (klass._hfields_ if use_hfields else klass._fields_):
+        datatype = f[1]
+        while isinstance(datatype, type) and issubclass(datatype, ctypes.Array):
+            datatype = datatype._type_
+        if not isinstance(datatype, type) or issubclass(datatype, Enum):
+            continue
+        if dataclasses.is_dataclass(datatype):
+            assert hasattr(datatype, '_hfields_'), \
+                f"{klass.__name__}.{f[0]}: nested {datatype.__name__} must call generate_hfields() first"
+            get_ctype_class(datatype)
+            deps.append(datatype)
+        elif issubclass(datatype, ctypes.Structure):
+            assert not use_hfields or hasattr(datatype, '_hfields_'), \
+                f"{klass.__name__}.{f[0]}: nested {datatype.__name__} must call generate_hfields() first"
+            deps.append(datatype)
+    return deps
+
+
+def order_ctype_structs(klasses, use_hfields=False):
+    """
+    Returns klasses plus the structs nested in them, each struct after the structs it contains
+    so the C typedefs are declared before they are used. Otherwise keeps the given order
+    """
+    ordered = []
+    done = set()
+    visiting = set()
+    def visit(klass):
+        if klass in done:
+            return
+        assert klass not in visiting, f"Recursive struct nesting in {klass.__name__}"
+        visiting.add(klass)
+        for dep in _struct_dependencies(klass, use_hfields):
+            visit(dep)
+        visiting.discard(klass)
+        done.add(klass)
+        ordered.append(klass)
+    for klass in klasses:
+        visit(klass)
+    return ordered
+
+
 def CtypeToODict(klasses, use_hfields=False):
     # Generate C header for specified ctypes class
     odict = collections.OrderedDict()
     for klass in klasses:
-        klstype, klsinst = ctype2stdc_helper( "", repr(klass) )
+        klstype = klass.__name__
         odict[klstype] = collections.OrderedDict()
         if hasattr(klass,'_pack_'):
             odict[klstype]['pack'] = klass._pack_
@@ -89,7 +178,7 @@ def CtypeToODict(klasses, use_hfields=False):
                 if len(f) == 3: #If is an array of enum type
                     inst += f'[{f[2]}]'
             else:
-                stdc, inst = ctype2stdc_helper( variable, repr(datatype) )
+                stdc, inst = ctype_stdc_decl(variable, datatype)
             odict[klstype]['fields'][inst] = stdc
 
     return odict
@@ -97,7 +186,7 @@ def CtypeToODict(klasses, use_hfields=False):
 #use_hfields provides a "no type checking" way to generate headers
 def write_ctype_structs(fh, ctype_structs, use_hfields=False):
 
-    structures = CtypeToODict(ctype_structs, use_hfields)
+    structures = CtypeToODict(order_ctype_structs(ctype_structs, use_hfields), use_hfields)
     for struct, contents in structures.items():
         if 'pack' in contents:
             fh.write("#pragma pack(push, %d)\n" % contents['pack'])
@@ -142,30 +231,846 @@ def _create_ctype_class(name, base, fields, pack=None):
     CtypesStruct.__name__ = name
     return CtypesStruct
 
+def _is_datagen_struct(field_type):
+  return isinstance(field_type, type) and hasattr(field_type, '_hfields_') and dataclasses.is_dataclass(field_type)
+
+def _binary_ctype(field_type):
+  """ctype of an _hfields_ type in the binary layout. Nested datagen structs use their generated ctypes class"""
+  if isinstance(field_type, type) and issubclass(field_type, ctypes.Array):
+    element = _binary_ctype(field_type._type_)
+    return field_type if element is field_type._type_ else element * field_type._length_
+  if _is_datagen_struct(field_type):
+    return get_ctype_class(field_type)
+  return field_type
+
 def _convert_hfields_to_fields(hfields):
   fields = []
   for field in hfields:
     if issubclass(field[1], Enum):
-      fields.append( (field[0], ctypes.c_uint32))
+      if len(field) == 3: #Array of enum type
+        fields.append( (field[0], ctypes.c_uint32 * field[2]))
+      else:
+        fields.append( (field[0], ctypes.c_uint32))
     else:
-      fields.append(field)
+      fields.append( (field[0], _binary_ctype(field[1])) )
   return fields
 
 
+#Generated ctypes classes keyed by datagen class. Each entry holds a snapshot of the
+#_hfields_ it was built from so a changed layout triggers a rebuild
+_ctype_class_cache = {}
+
+def get_ctype_class(cls):
+  """
+  Returns the ctypes.Structure class with the binary layout of cls._hfields_ (honors _pack_)
+  The class is built once per datagen class and reused until _hfields_ changes
+  """
+  assert hasattr(cls, "_hfields_"), "Datagen objects which use ctypes should first call generate_hfields() before calling "
+  cached = _ctype_class_cache.get(cls)
+  if cached is not None and cached[0] == cls._hfields_:
+    return cached[1]
+  ctype_class = _create_ctype_class(f'{cls.__name__}_ctypes', ctypes.Structure,
+                           _convert_hfields_to_fields(cls._hfields_), getattr(cls, '_pack_', None))
+  _ctype_class_cache[cls] = (list(cls._hfields_), ctype_class)
+  _encoder_cache.pop(cls, None)
+  return ctype_class
+
+def clear_ctype_class_cache(cls=None):
+  """Drops the cached ctypes class (and encoder) of cls, or of every class if cls is None"""
+  if cls is None:
+    _ctype_class_cache.clear()
+    _encoder_cache.clear()
+  else:
+    _ctype_class_cache.pop(cls, None)
+    _encoder_cache.pop(cls, None)
+
+
+#struct module codes by (size, signed) for integer ctypes
+_struct_int_codes = {(1, False): 'B', (2, False): 'H', (4, False): 'I', (8, False): 'Q',
+                     (1, True): 'b',  (2, True): 'h',  (4, True): 'i',  (8, True): 'q'}
+
+class _UnsupportedCtype(Exception):
+  """A field type without a struct format, its class is encoded through the ctypes class instead"""
+
+def _struct_code(ctype):
+  code = getattr(ctype, '_type_', None)
+  if code in ('f', 'd', '?'):
+    return code
+  if code == 'c':
+    #c_char is stored as its byte value, bytes values are converted by _wrap_int
+    return 'B'
+  if not (isinstance(code, str) and code in 'bBhHiIlLqQ'):
+    raise _UnsupportedCtype(ctype.__name__)
+  return _struct_int_codes[(ctypes.sizeof(ctype), code.islower())]
+
+def _wrap_int(value, code):
+  """Truncates value to the width of an integer struct code, like assigning it to a ctypes field"""
+  if isinstance(value, bytes):
+    value = value[0] if value else 0
+  bits = struct.calcsize(code) * 8
+  value = int(value) & ((1 << bits) - 1)
+  if code.islower() and value >> (bits - 1):
+    value -= 1 << bits
+  return value
+
+
+class _EncoderLayout:
+  """struct format under construction. Leaf values are added in increasing offset order, gaps become pad bytes"""
+  def __init__(self):
+    self.fmt = ['=']
+    self.codes = []
+    self.pos = 0
+
+  def add(self, offset, code, count=1):
+    assert offset >= self.pos, "Binary layout fields must be in increasing offset order"
+    if offset > self.pos:
+      self.fmt.append(f'{offset - self.pos}x')
+    self.fmt.append(f'{count}{code}')
+    self.codes.extend([code] * count)
+    self.pos = offset + struct.calcsize(f'={count}{code}')
+
+  def finish(self, size):
+    if size > self.pos:
+      self.fmt.append(f'{size - self.pos}x')
+    return struct.Struct(''.join(self.fmt))
+
+
+def _compile_value(field_type, ctype, offset, layout):
+  """
+  Compiles the encoder of one value of an _hfields_ type stored at offset as ctype
+  Returns (flatten(value, out), number of leaf values) where flatten appends the leaf values to out
+  """
+  if issubclass(ctype, ctypes.Array):
+    length, element_ctype = ctype._length_, ctype._type_
+    element_type = field_type._type_ if issubclass(field_type, ctypes.Array) else field_type
+    if not issubclass(element_ctype, (ctypes.Array, ctypes.Structure)):
+      #Flat array of scalars or enums
+      layout.add(offset, _struct_code(element_ctype), length)
+      if issubclass(element_type, Enum):
+        lookup = _enum_lookup(element_type)
+        def flatten_array(values, out):
+          if values is None:
+            values = ()
+          assert len(values) <= length, f"List of {len(values)} items exceeds its array size {length}"
+          out.extend([lookup[value] if value in lookup else _enum_value(element_type, value) for value in values])
+          out.extend(itertools.repeat(0, length - len(values)))
+      else:
+        def flatten_array(values, out):
+          if values is None:
+            values = ()
+          assert len(values) <= length, f"List of {len(values)} items exceeds its array size {length}"
+          out.extend(values)
+          out.extend(itertools.repeat(0, length - len(values)))
+      return flatten_array, length
+
+    element_size = ctypes.sizeof(element_ctype)
+    flatten_element, element_count = _compile_value(element_type, element_ctype, offset, layout)
+    for index in range(1, length):
+      _compile_value(element_type, element_ctype, offset + index * element_size, layout)
+    def flatten_array(values, out):
+      if values is None:
+        values = ()
+      assert len(values) <= length, f"List of {len(values)} items exceeds its array size {length}"
+      for value in values:
+        flatten_element(value, out)
+      out.extend(itertools.repeat(0, (length - len(values)) * element_count))
+    return flatten_array, length * element_count
+
+  if _is_datagen_struct(field_type):
+    #The struct's flatten function is generated as python source with scalar and enum fields inlined
+    lines = ["def flatten_struct(obj, out):",
+             "  if obj is None:",
+             "    out.extend(repeat(0, count))",
+             "    return"]
+    namespace = {'repeat': itertools.repeat, '_enum_value': _enum_value}
+    count = 0
+    ctype_fields = dict(ctype._fields_)
+    for index, hfield in enumerate(field_type._hfields_):
+      name = hfield[0]
+      field_ctype = ctype_fields[name]
+      field_offset = offset + getattr(ctype, name).offset
+      if issubclass(hfield[1], Enum) and not issubclass(field_ctype, ctypes.Array):
+        layout.add(field_offset, _struct_code(field_ctype))
+        namespace[f'enum_{index}'] = hfield[1]
+        namespace[f'lookup_{index}'] = _enum_lookup(hfield[1])
+        lines += [f"  value = obj.{name}",
+                  f"  out.append(lookup_{index}[value] if value in lookup_{index} else _enum_value(enum_{index}, value))"]
+        count += 1
+      elif not issubclass(field_ctype, (ctypes.Array, ctypes.Structure)):
+        layout.add(field_offset, _struct_code(field_ctype))
+        lines += [f"  value = obj.{name}",
+                  f"  out.append(0 if value is None else value)"]
+        count += 1
+      else:
+        flatten, field_count = _compile_value(hfield[1], field_ctype, field_offset, layout)
+        namespace[f'flatten_{index}'] = flatten
+        lines.append(f"  flatten_{index}(obj.{name}, out)")
+        count += field_count
+    namespace['count'] = count
+    exec("\n".join(lines), namespace)
+    return namespace['flatten_struct'], count
+
+  if issubclass(field_type, Enum):
+    layout.add(offset, _struct_code(ctype))
+    lookup = _enum_lookup(field_type)
+    def flatten_enum(value, out):
+      out.append(lookup[value] if value in lookup else _enum_value(field_type, value))
+    return flatten_enum, 1
+
+  layout.add(offset, _struct_code(ctype))
+  def flatten_scalar(value, out):
+    out.append(0 if value is None else value)
+  return flatten_scalar, 1
+
+
+def _enum_members(enum_type):
+  return {member.value: member for member in enum_type}
+
+
+def _compile_builder(field_type, ctype):
+  """
+  Compiles the decoder of one value of an _hfields_ type stored as ctype, the inverse of _compile_value
+  Returns (build(values, pos), number of leaf values) where build returns the value whose leaf values start at values[pos]
+  Enum values which are not members are kept as int
+  """
+  if issubclass(ctype, ctypes.Array):
+    length, element_ctype = ctype._length_, ctype._type_
+    element_type = field_type._type_ if issubclass(field_type, ctypes.Array) else field_type
+    if not issubclass(element_ctype, (ctypes.Array, ctypes.Structure)):
+      if issubclass(element_type, Enum):
+        members = _enum_members(element_type)
+        def build_array(values, pos):
+          return [members.get(value, value) for value in values[pos:pos + length]]
+      else:
+        def build_array(values, pos):
+          return list(values[pos:pos + length])
+      return build_array, length
+
+    build_element, element_count = _compile_builder(element_type, element_ctype)
+    def build_array(values, pos):
+      return [build_element(values, pos + index * element_count) for index in range(length)]
+    return build_array, length * element_count
+
+  if _is_datagen_struct(field_type):
+    #The struct's build function is generated as python source with scalar and enum fields inlined
+    #Fields excluded from __init__ (e.g. out only fields) are set once the object is built
+    init_fields = {f.name for f in dataclasses.fields(field_type) if f.init}
+    arguments = []
+    assignments = []
+    namespace = {'cls': field_type,
+                 'set_attr': object.__setattr__ if field_type.__dataclass_params__.frozen else setattr}
+    count = 0
+    ctype_fields = dict(ctype._fields_)
+    for index, hfield in enumerate(field_type._hfields_):
+      name = hfield[0]
+      field_ctype = ctype_fields[name]
+      if issubclass(hfield[1], Enum) and not issubclass(field_ctype, ctypes.Array):
+        namespace[f'members_{index}'] = _enum_members(hfield[1])
+        value = f"members_{index}.get(values[pos + {count}], values[pos + {count}])"
+        count += 1
+      elif not issubclass(field_ctype, (ctypes.Array, ctypes.Structure)):
+        value = f"values[pos + {count}]"
+        count += 1
+      else:
+        build, field_count = _compile_builder(hfield[1], field_ctype)
+        namespace[f'build_{index}'] = build
+        value = f"build_{index}(values, pos + {count})"
+        count += field_count
+      if name in init_fields:
+        arguments.append(f"    {name}={value},")
+      else:
+        assignments.append(f"  set_attr(obj, {name!r}, {value})")
+    lines = ["def build_struct(values, pos):", "  obj = cls(", *arguments, "  )", *assignments, "  return obj"]
+    exec("\n".join(lines), namespace)
+    return namespace['build_struct'], count
+
+  if issubclass(field_type, Enum):
+    members = _enum_members(field_type)
+    def build_enum(values, pos):
+      return members.get(values[pos], values[pos])
+    return build_enum, 1
+
+  def build_scalar(values, pos):
+    return values[pos]
+  return build_scalar, 1
+
+
+class _CtypeEncoder:
+  """
+  Compiled encoder of a datagen class's _hfields_ layout
+  Flattens an object (nested structs, enum and zero padded list fields included) into a list
+  of leaf values and packs them with a single precompiled struct.Struct
+  unpack_from() is the reverse direction, its builder is only compiled when first used
+  """
+  def __init__(self, cls):
+    self.cls = cls
+    self.build = None
+    self.ctype_class = get_ctype_class(cls)
+    self.size = ctypes.sizeof(self.ctype_class)
+    layout = _EncoderLayout()
+    self.flatten = _compile_value(cls, self.ctype_class, 0, layout)[0]
+    self.codes = layout.codes
+    self.packer = layout.finish(self.size)
+    assert self.packer.size == self.size, f"Encoder layout of {cls.__name__} does not match its ctypes layout"
+
+  def values(self, datagen_obj):
+    values = []
+    self.flatten(datagen_obj, values)
+    return values
+
+  def wrap(self, values):
+    """Out of range integers are truncated, as ctypes fields do"""
+    return [value if code in ('f', 'd', '?') else _wrap_int(value, code) for value, code in zip(values, self.codes)]
+
+  def pack(self, datagen_obj):
+    values = self.values(datagen_obj)
+    try:
+      return self.packer.pack(*values)
+    except struct.error:
+      return self.packer.pack(*self.wrap(values))
+
+  def pack_into(self, datagen_obj, buffer, offset):
+    values = self.values(datagen_obj)
+    try:
+      self.packer.pack_into(buffer, offset, *values)
+    except struct.error:
+      self.packer.pack_into(buffer, offset, *self.wrap(values))
+
+  def unpack_from(self, buffer, offset=0):
+    """Decodes the record at offset into a new instance of the datagen class. Call inside skip_validation()"""
+    if self.build is None:
+      self.build = _compile_builder(self.cls, self.ctype_class)[0]
+    return self.build(self.packer.unpack_from(buffer, offset), 0)
+
+
+class _CtypeObjEncoder:
+  """
+  Encoder of classes with fields the compiled encoder has no struct format for (e.g. c_wchar_p)
+  Fills an instance of the ctypes class and copies its bytes, as write_ctype_obj_binary always did
+  """
+  def __init__(self, cls):
+    self.cls = cls
+    self.ctype_class = get_ctype_class(cls)
+    self.size = ctypes.sizeof(self.ctype_class)
+    self.names = [name for name, *_ in self.ctype_class._fields_]
+
+  def pack(self, datagen_obj):
+    return bytes(self.ctype_class(**{name: getattr(datagen_obj, name) for name in self.names}))
+
+  def pack_into(self, datagen_obj, buffer, offset):
+    buffer[offset:offset + self.size] = self.pack(datagen_obj)
+
+  def unpack_from(self, buffer, offset=0):
+    assert False, f"{self.cls.__name__} has fields which can not be decoded from binaries. Character pointers and pointers in general are not supported"
+
+
+#Compiled encoders keyed by datagen class. Dropped with the ctypes class when _hfields_ change
+_encoder_cache = {}
+
+def get_ctype_encoder(cls):
+  """Returns the compiled binary encoder of a datagen class"""
+  ctype_class = get_ctype_class(cls)
+  encoder = _encoder_cache.get(cls)
+  if encoder is None or encoder.ctype_class is not ctype_class:
+    try:
+      encoder = _CtypeEncoder(cls)
+    except _UnsupportedCtype:
+      encoder = _CtypeObjEncoder(cls)
+    _encoder_cache[cls] = encoder
+  return encoder
+
+def ctype_obj_size(cls):
+  """Size in bytes of the binary record of a datagen class"""
+  return ctypes.sizeof(get_ctype_class(cls))
+
+def encode_ctype_obj(datagen_obj, buffer, offset=0):
+  """
+  Encodes datagen_obj in its _hfields_ binary layout directly into a writable buffer
+  (bytearray, memoryview, mmap ...) at offset, without intermediate copies
+  Nested datagen structs, enums and enum lists are supported, lists shorter than their array are zero padded
+  Returns the offset just after the record
+  """
+  encoder = get_ctype_encoder(type(datagen_obj))
+  encoder.pack_into(datagen_obj, buffer, offset)
+  return offset + encoder.size
+
+def encode_ctype_objs(datagen_objs, buffer, offset=0):
+  """Encodes datagen objects back to back into buffer starting at offset. Returns the end offset"""
+  obj_type = None
+  for datagen_obj in datagen_objs:
+    if type(datagen_obj) is not obj_type:
+      obj_type = type(datagen_obj)
+      encoder = get_ctype_encoder(obj_type)
+    encoder.pack_into(datagen_obj, buffer, offset)
+    offset += encoder.size
+  return offset
+
+
+def ctype_struct_layout(cls, use_hfields=True):
+  """
+  Binary layout of a struct class as a JSON serializable dict: size, pack and per field
+  C type, offset and size. Used for the datagen_types.h layout manifest
+  """
+  fields = cls._hfields_ if use_hfields else cls._fields_
+  ctype_class = get_ctype_class(cls) if use_hfields else cls
+  c_fields = CtypeToODict([cls], use_hfields)
+  layout = {'size': ctypes.sizeof(ctype_class), 'pack': getattr(cls, '_pack_', None), 'fields': []}
+  for f, (inst, stdc) in zip(fields, next(iter(c_fields.values()))['fields'].items()):
+    descriptor = getattr(ctype_class, f[0])
+    layout['fields'].append({'name': inst, 'type': stdc, 'offset': descriptor.offset, 'size': descriptor.size})
+  return layout
+
+
+#Called with the name of every binary file written. Set by DatagenBase to collect outputs for its cache
+_output_recorder = None
+
+def _record_output(filename):
+  if _output_recorder is not None:
+    _output_recorder(filename)
+
+
+def write_ctype_objs(datagen_objs, fh):
+  """
+  Streams the binary of each datagen object back to back into an already open binary file handle
+  Same requirements as write_ctype_obj_binary. The encoder is looked up once per object type
+  Returns the number of objects written
+  """
+  count = 0
+  obj_type = None
+  with profiler.stage('write_binary'):
+    for datagen_obj in datagen_objs:
+      if type(datagen_obj) is not obj_type:
+        assert dataclasses.is_dataclass(datagen_obj), "Must pass in a dataclasses object"
+        obj_type = type(datagen_obj)
+        encoder = get_ctype_encoder(obj_type)
+      fh.write(encoder.pack(datagen_obj))
+      count += 1
+  if isinstance(getattr(fh, 'name', None), str):
+    _record_output(fh.name)
+  return count
+
+
 def write_ctype_obj_binary(datagen_obj, filename):
   """
   Writes out a binary files of the data provided.
   Requires datagen_obj to have called generate_hfields to define _hfields_.
   datagen_obj must also be a "dataclass" class.
-  Currently there is limited nesting support. 
+  Nested datagen structs (which also called generate_hfields) and lists of them are supported.
+  Lists shorter than their array size are zero padded.
   Character pointers and pointers in general are not supported. 
   """
   assert hasattr(datagen_obj, "_hfields_"), "Datagen objects which use ctypes should first call generate_hfields() before calling "
   assert dataclasses.is_dataclass(datagen_obj), "Must pass in a dataclasses object"
-  
-  FrameData_ctype = _create_ctype_class(f'{datagen_obj.__class__.__name__}_ctypes', ctypes.Structure,
-                           _convert_hfields_to_fields(datagen_obj._hfields_))
-  myFrame_dict = {dc_field.name: getattr(datagen_obj,dc_field.name) for dc_field in dataclasses.fields(datagen_obj) }
-  myFrame_ctype = FrameData_ctype(**myFrame_dict)
   with open(filename, 'wb') as fh:
-    fh.write(myFrame_ctype)
\ No newline at end of file
+    write_ctype_objs([datagen_obj], fh)
+
+
+def ctype_obj_dtype(cls):
+  """
+  Returns the NumPy structured dtype matching the binary layout of cls._hfields_
+  Honors _pack_. Enums are stored as uint32 and lists as fixed size sub-arrays
+  """
+  import numpy as np
+  return np.dtype(get_ctype_class(cls))
+
+
+def _enum_value(enum_type, value):
+  return enum_type[value].value if isinstance(value, str) else int(value)
+
+
+def _enum_lookup(enum_type):
+  """Integer value of every member and member name of enum_type, None encodes as 0"""
+  lookup = {None: 0}
+  for name, member in enum_type.__members__.items():
+    lookup[name] = member.value
+    lookup[member] = member.value
+  return lookup
+
+
+def _column_converter(field_type):
+  """
+  Returns convert(values) giving field values as integers the way the compiled encoder converts them:
+  enum members or names, None as 0 and bytes as their first byte. None when values can be assigned as they are
+  """
+  if issubclass(field_type, Enum):
+    lookup = _enum_lookup(field_type)
+    return lambda values: [lookup[value] if value in lookup else _enum_value(field_type, value) for value in values]
+  return None
+
+
+def _scalar_values(values):
+  return [0 if value is None else (value[0] if value else 0) if isinstance(value, bytes) else value for value in values]
+
+
+def _set_column(target, values, convert):
+  """Assigns values to a column (or one row of an array field), truncating out of range integers like the encoder"""
+  import numpy as np
+  if convert is not None:
+    values = convert(values)
+  if target.dtype.kind == 'S':
+    #c_char is a one byte string to NumPy, its values are stored as byte values
+    target = target.view(np.uint8)
+    values = _scalar_values(values)
+  try:
+    target[...] = values
+  except (TypeError, OverflowError, ValueError):
+    if target.dtype.kind not in 'iu':
+      raise
+    target[...] = [_wrap_int(value, target.dtype.char) for value in _scalar_values(values)]
+
+
+def _fill_ctype_objs_array(array, objs, hfields):
+  """Fills the structured array column by column from the datagen objects"""
+  for hfield in hfields:
+    name, field_type = hfield[0:2]
+    column = [getattr(obj, name) for obj in objs]
+    if array.dtype[name].subdtype is None:
+      _set_column(array[name], column, _column_converter(field_type))
+    else:
+      #Fixed size array. Shorter lists are zero padded
+      rows = array[name]
+      convert = _column_converter(field_type if issubclass(field_type, Enum) else field_type._type_)
+      for row, values in enumerate(column):
+        if values is None:
+          continue
+        _set_column(rows[row, :len(values)], values, convert)
+
+
+def _is_flat_dtype(dtype):
+  """True if every field is a scalar or a 1D array of scalars, which _fill_ctype_objs_array handles"""
+  for name in dtype.names:
+    field_dtype = dtype[name]
+    if field_dtype.subdtype is not None:
+      base, shape = field_dtype.subdtype
+      if base.fields is not None or len(shape) != 1:
+        return False
+    elif field_dtype.fields is not None:
+      return False
+  return True
+
+
+def write_ctype_objs_numpy(objs, filename, chunk_size=65536):
+  """
+  Writes many datagen objects back to back into one binary file
+  Same record layout as write_ctype_obj_binary, but built as a NumPy structured array column-wise
+  objs may be a list or an iterator. All objects must share the same _hfields_ layout
+  Iterators are consumed in chunks of chunk_size objects to bound memory
+  Layouts with nested structs or multi-dimensional arrays are filled record-wise by the encoder
+  Returns the number of records written
+  """
+  import numpy as np
+  objs = iter(objs)
+  cls = None
+  count = 0
+  with profiler.stage('write_binary'), open(filename, 'wb') as fh:
+    while True:
+      chunk = list(itertools.islice(objs, chunk_size))
+      if not chunk:
+        break
+      if cls is None:
+        cls = type(chunk[0])
+        assert dataclasses.is_dataclass(cls), "Must pass in dataclasses objects"
+        dtype = ctype_obj_dtype(cls)
+        flat = _is_flat_dtype(dtype)
+      assert all(type(obj) is cls for obj in chunk), f"All objects must be of type {cls.__name__}"
+      array = np.zeros(len(chunk), dtype=dtype)
+      if flat:
+        _fill_ctype_objs_array(array, chunk, cls._hfields_)
+      else:
+        encode_ctype_objs(chunk, array.view(np.uint8))
+      array.tofile(fh)
+      count += len(chunk)
+  _record_output(filename)
+  return count
+
+
+def read_ctype_objs_numpy(cls, filename, mode='r'):
+  """
+  Memory-maps a file written by write_ctype_objs_numpy (or write_ctype_obj_binary) as a
+  NumPy structured array with cls's layout. No data is copied until it is accessed
+  """
+  import numpy as np
+  return np.memmap(filename, dtype=ctype_obj_dtype(cls), mode=mode)
+
+
+def decode_ctype_obj(cls, buffer, offset=0):
+  """
+  Decodes the cls record at offset of a buffer (bytes, bytearray, memoryview, mmap ...), the inverse of encode_ctype_obj
+  Enums are restored from their uint32 value. Lists come back with their full array size, padding included
+  Fields which are not in _hfields_ get their defaults. Type checks are skipped, the layout guarantees the types
+  """
+  from datagenDV.params_base import skip_validation
+  with skip_validation():
+    return get_ctype_encoder(cls).unpack_from(buffer, offset)
+
+def decode_ctype_objs(cls, buffer, offset=0, count=None):
+  """Lazily decodes count back to back cls records (all that fit by default) starting at offset"""
+  from datagenDV.params_base import skip_validation
+  encoder = get_ctype_encoder(cls)
+  if count is None:
+    count = (len(buffer) - offset) // encoder.size
+  assert offset + count * encoder.size <= len(buffer), f"Buffer holds less than {count} {cls.__name__} records"
+  for index in range(count):
+    #Entered per record so validation is not skipped for the caller's code between records
+    with skip_validation():
+      obj = encoder.unpack_from(buffer, offset + index * encoder.size)
+    yield obj
+
+
+class CtypeObjReader:
+  """
+  Read-only view of a binary file of cls records, e.g. a DUT output memory dump written with the
+  same _hfields_/_pack_ layout as write_ctype_objs. The file is memory-mapped and records are only
+  decoded into cls instances when indexed or iterated, so multi-GB files are streamed
+  array() maps the same records as a NumPy structured array for vectorized checks
+  """
+  def __init__(self, cls, filename, offset=0, count=None):
+    self.cls = cls
+    self.filename = filename
+    self.offset = offset
+    self.record_size = ctype_obj_size(cls)
+    self._fh = open(filename, 'rb')
+    file_size = os.fstat(self._fh.fileno()).st_size
+    #Empty files can not be mapped
+    self._mmap = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ) if file_size else b''
+    available = max(file_size - offset, 0) // self.record_size
+    if count is None:
+      count = available
+      if offset + count * self.record_size != file_size:
+        print(f"WARNING: {filename} ends with {file_size - offset - count * self.record_size} bytes of a partial {cls.__name__} record")
+    assert count <= available, f"{filename} holds {available} {cls.__name__} records, {count} requested"
+    self.count = count
+
+  def __len__(self):
+    return self.count
+
+  def __getitem__(self, index):
+    if index < 0:
+      index += self.count
+    if not 0 <= index < self.count:
+      raise IndexError(f"{self.cls.__name__} record {index} out of range")
+    return decode_ctype_obj(self.cls, self._mmap, self.offset + index * self.record_size)
+
+  def __iter__(self):
+    return decode_ctype_objs(self.cls, self._mmap, self.offset, self.count)
+
+  def array(self):
+    """The records as a read-only NumPy structured array (np.memmap), fields named like _hfields_"""
+    import numpy as np
+    return np.memmap(self.filename, dtype=ctype_obj_dtype(self.cls), mode='r', offset=self.offset, shape=(self.count,))
+
+  def close(self):
+    if self._mmap:
+      self._mmap.close()
+    self._fh.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
+
+
+def read_ctype_objs(cls, filename, offset=0, count=None):
+  """
+  Streams the cls records of a binary file as datagen objects, see CtypeObjReader
+  The file is closed once the iteration finishes
+  """
+  with CtypeObjReader(cls, filename, offset, count) as reader:
+    yield from reader
+
+
+class MemoryImage:
+  """
+  Image of a device address space built by placing encoded datagen objects at addresses
+  Only populated bytes are stored: by default as a sorted list of segments, each a bytearray,
+  or with filename and size in a sparse memory-mapped file covering [base, base + size),
+  whose untouched pages take neither memory nor disk space. Overlapping placements assert
+  Exports to raw binary (gaps zero filled, left as file holes), Intel HEX and a JSON segment manifest
+  """
+  def __init__(self, base=0, size=None, filename=None):
+    self.base = base
+    self.size = size
+    self.filename = filename
+    self._starts = []
+    self._ends = []
+    self._data = []  #bytearray per segment, unused with a backing file
+    self._objects = []  #(address, size, class name, label) of each placement
+    self._fh = None
+    self._mmap = None
+    if filename is not None:
+      assert size, "A file backed MemoryImage needs the size of its address range"
+      self._fh = open(filename, 'w+b')
+      #Extending with truncate leaves a hole, no blocks are allocated until written
+      self._fh.truncate(size)
+      self._mmap = mmap.mmap(self._fh.fileno(), size)
+
+  def _check_open(self):
+    if self.filename is not None and self._mmap is None:
+      raise ValueError(f"MemoryImage {self.filename} is closed")
+
+  def _reserve(self, address, length):
+    """Adds [address, address + length) to the segments. Returns (buffer, offset) to write it at"""
+    self._check_open()
+    end = address + length
+    assert address >= self.base, f"[{address:#x}, {end:#x}) starts below the image base {self.base:#x}"
+    assert self.size is None or end <= self.base + self.size, \
+      f"[{address:#x}, {end:#x}) ends after the image [{self.base:#x}, {self.base + self.size:#x})"
+    index = bisect.bisect_right(self._starts, address)
+    if index > 0 and self._ends[index - 1] > address:
+      assert False, f"[{address:#x}, {end:#x}) overlaps the segment [{self._starts[index - 1]:#x}, {self._ends[index - 1]:#x})"
+    if index < len(self._starts) and self._starts[index] < end:
+      assert False, f"[{address:#x}, {end:#x}) overlaps the segment [{self._starts[index]:#x}, {self._ends[index]:#x})"
+    if index > 0 and self._ends[index - 1] == address:
+      #Appending to the previous segment, the usual case of objects placed in address order
+      index -= 1
+      self._ends[index] = end
+      if self._mmap is not None:
+        return self._mmap, address - self.base
+      data = self._data[index]
+      offset = len(data)
+      data.extend(bytes(length))
+      return data, offset
+    self._starts.insert(index, address)
+    self._ends.insert(index, end)
+    if self._mmap is not None:
+      return self._mmap, address - self.base
+    self._data.insert(index, bytearray(length))
+    return self._data[index], 0
+
+  def place(self, datagen_obj, address, label=None):
+    """Encodes datagen_obj (see encode_ctype_obj) at address. Returns the address just after it"""
+    #Encoded before the range is reserved, so an object failing to encode leaves the image unchanged
+    data = get_ctype_encoder(type(datagen_obj)).pack(datagen_obj)
+    end = self.write(address, data)
+    self._objects.append((address, len(data), type(datagen_obj).__name__, label))
+    return end
+
+  def place_objs(self, datagen_objs, address, label=None):
+    """Places datagen objects back to back from address, e.g. a descriptor ring. Returns the end address"""
+    for datagen_obj in datagen_objs:
+      address = self.place(datagen_obj, address, label)
+    return address
+
+  def write(self, address, data):
+    """Places raw bytes (any bytes-like object) at address. Returns the address just after them"""
+    data = memoryview(data).cast('B')
+    buffer, offset = self._reserve(address, len(data))
+    buffer[offset:offset + len(data)] = data
+    return address + len(data)
+
+  def read(self, address, length):
+    """length bytes from address, unpopulated bytes read as zero"""
+    result = bytearray(length)
+    for start, data in self._chunks(address, address + length):
+      result[start - address:start - address + len(data)] = data
+    return bytes(result)
+
+  def read_ctype_obj(self, cls, address):
+    """Decodes the cls record at address, see decode_ctype_obj"""
+    return decode_ctype_obj(cls, self.read(address, ctype_obj_size(cls)))
+
+  def _segment_bytes(self, index, start, stop):
+    if self._mmap is not None:
+      return self._mmap[start - self.base:stop - self.base]
+    offset = self._starts[index]
+    return self._data[index][start - offset:stop - offset]
+
+  def segments(self):
+    """(address, length) of each populated range, adjacent placements are coalesced"""
+    segments = []
+    for start, end in zip(self._starts, self._ends):
+      if segments and segments[-1][0] + segments[-1][1] == start:
+        segments[-1] = (segments[-1][0], end - segments[-1][0])
+      else:
+        segments.append((start, end - start))
+    return segments
+
+  def populated_bytes(self):
+    return sum(end - start for start, end in zip(self._starts, self._ends))
+
+  def _chunks(self, start, end, chunk_size=1 << 20):
+    """(address, bytes) of the populated data in [start, end), at most chunk_size bytes each"""
+    self._check_open()
+    index = max(bisect.bisect_right(self._starts, start) - 1, 0)
+    while index < len(self._starts) and self._starts[index] < end:
+      seg_start, seg_end = max(self._starts[index], start), min(self._ends[index], end)
+      for address in range(seg_start, seg_end, chunk_size):
+        yield address, self._segment_bytes(index, address, min(address + chunk_size, seg_end))
+      index += 1
+
+  def write_binary(self, filename, start=None, end=None):
+    """
+    Writes [start, end) as a raw binary, by default from the lowest to the highest populated address
+    Gaps are skipped with seek, so they read as zero and stay holes on file systems with sparse files
+    Returns the address of the first byte of the file
+    """
+    self._check_open()
+    if start is None:
+      start = self._starts[0] if self._starts else self.base
+    if end is None:
+      end = self._ends[-1] if self._ends else start
+    with open(filename, 'wb') as fh:
+      for address, data in self._chunks(start, end):
+        fh.seek(address - start)
+        fh.write(data)
+      fh.truncate(end - start)
+    _record_output(filename)
+    return start
+
+  def write_ihex(self, filename, record_size=16):
+    """Writes the populated bytes as Intel HEX (I32HEX: data, extended linear address and end of file records)"""
+    self._check_open()
+    assert not self._ends or self._ends[-1] <= 1 << 32, "Intel HEX addresses are limited to 32 bits"
+    def record(record_type, address, data):
+      fields = bytes([len(data), (address >> 8) & 0xFF, address & 0xFF, record_type]) + data
+      return f":{fields.hex().upper()}{(-sum(fields)) & 0xFF:02X}\n"
+    upper = 0
+    with open(filename, 'w') as fh:
+      for address, data in self._chunks(self.base, self._ends[-1] if self._ends else self.base):
+        position = 0
+        while position < len(data):
+          record_address = address + position
+          #Records do not cross 64KiB boundaries, so the lower 16 bits never wrap
+          length = min(record_size, len(data) - position, 0x10000 - (record_address & 0xFFFF))
+          if record_address >> 16 != upper:
+            upper = record_address >> 16
+            fh.write(record(0x04, 0, upper.to_bytes(2, 'big')))
+          fh.write(record(0x00, record_address & 0xFFFF, data[position:position + length]))
+          position += length
+      fh.write(record(0x01, 0, b''))
+    _record_output(filename)
+
+  def manifest(self):
+    """The segments and placed objects as a JSON serializable dict"""
+    segments = []
+    for address, length in self.segments():
+      sha256 = hashlib.sha256()
+      for _, data in self._chunks(address, address + length):
+        sha256.update(data)
+      segments.append({'address': address, 'size': length, 'sha256': sha256.hexdigest()})
+    return {'base': self.base, 'size': self.size, 'populated_bytes': self.populated_bytes(), 'segments': segments,
+            'objects': [{'address': address, 'size': size, 'class': name, 'label': label}
+                        for address, size, name, label in sorted(self._objects, key=lambda o: o[0])]}
+
+  def write_manifest(self, filename):
+    with open(filename, 'w') as fh:
+      json.dump(self.manifest(), fh, indent=2)
+    _record_output(filename)
+
+  def flush(self):
+    if self._mmap is not None:
+      self._mmap.flush()
+
+  def close(self):
+    if self._mmap is not None:
+      self._mmap.close()
+      self._fh.close()
+      self._mmap = self._fh = None
+      _record_output(self.filename)
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc):
+    self.close()
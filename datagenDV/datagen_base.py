@@ -9,13 +9,38 @@ Author: jonathan.george@microsoft.com
 import argparse
 from ruamel.yaml import YAML, MappingNode
 from ruamel.yaml.constructor import SafeConstructor
+from ruamel.yaml.representer import SafeRepresenter, RoundTripRepresenter
+from ruamel.yaml.composer import Composer
+from ruamel.yaml.events import StreamEndEvent, SequenceStartEvent, SequenceEndEvent
 
 import sys, os
 import random
 import re
 import shutil
+import hashlib
+import io
+import json
+import multiprocessing
+import atexit
+import copy
+import time
+import threading
+import contextlib
+import socketserver
+import traceback
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 
+import sysconfig
 from datagenDV import ctypes_helper
+from datagenDV import profiler
+from datagenDV import output_cache
+from datagenDV.params_base import ParamsBase, seed_object, field_items, _seed_streams
+from datagenDV.yaml_params_base import YAMLParamsBase
+import dataclasses
+
+#Arguments which configure the output cache and do not change the outputs, left out of its keys
+_CACHE_OPTIONS = ('cache', 'no_cache', 'cache_dir', 'cache_size', 'cache_link')
 
 class DatagenBase():
     """
@@ -23,15 +48,35 @@ class DatagenBase():
 
     Covers common functionality for loading params, yaml ect.
     Can generate C headers
+    Subclasses define main(), which generates the outputs of one test from self.yaml_dict
+    (typically ending with self.write_outputs()). run() calls it once per test
 
     usage:
     <script> <input YAML file name> <output YAML file name>
+
+    Batch mode generates --count tests from one invocation:
+    <script> <input YAML> <output YAML> --count N --jobs J --seed_base S
+    Test i is written to <output YAML stem>_<i>.<ext> using a seed derived from S and i
+
+    --profile writes per stage/per DatagenClass timings to <output YAML stem>.profile.json
+
+    Server mode keeps the process (and --jobs forked workers) alive and generates one test per request:
+    <script> --serve             JSON lines requests on stdin, responses on stdout
+    <script> --serve <socket>    the same protocol over a Unix socket, one connection per client
+    See serve() for the request format
+
+    --cache (or DATAGEN_CACHE=1 in the environment) caches the outputs of tests run with --seed, keyed by
+    the input YAML content, every command line argument, the source files of the datagen script and its
+    registered classes, and the library version. A rerun with the same key restores output_yaml,
+    datagen_types.h and the binaries written through ctypes_helper instead of running main()
+    Only use it when main() passes any other file it writes to record_output(), those are not restored
+    --no_cache overrides DATAGEN_CACHE, --cache_dir/--cache_size/--cache_link configure the cache
     """
 
     def __init__(self, description="Datagen Base class "):
         self.args = None
-        self.yaml = YAML()
-        self.yaml.Constructor = DatagenConstructor
+        self.profiler = None
+        self.cache_outputs = None #output files of the running test, None when it is not cached
         self.suite = None #test yaml input object
         self.datagen_types_header = """
 //
@@ -44,16 +89,45 @@ class DatagenBase():
 
         self.clean()
         self.parse_args(description)
+        if self.args.profile or self.args.profile_cprofile:
+            self.start_profile()
+        self.yaml_engine = self.args.yaml_engine
+        self.yaml = create_yaml(self.yaml_engine)
         self.setup()
 
     def parse_args(self, description):
         parser = argparse.ArgumentParser(description=description)
-        parser.add_argument('input_yaml', type=str, help='input YAML file')
-        parser.add_argument('output_yaml', type=str, help='output YAML file')
+        parser.add_argument('input_yaml', type=str, nargs='?', help='input YAML file')
+        parser.add_argument('output_yaml', type=str, nargs='?', help='output YAML file')
         parser.add_argument('--header_path', type=str, help='header path', default=".")
         parser.add_argument('--seed', type=str, help='header path', default=None)
+        parser.add_argument('--yaml_engine', type=str, choices=YAML_ENGINES, default='rt',
+                            help='YAML engine. rt: round-trip (default), fast: C libyaml safe loader/dumper')
+        parser.add_argument('--count', type=int, help='batch mode: number of tests to generate', default=None)
+        parser.add_argument('--jobs', type=int, help='batch mode: number of worker processes', default=1)
+        parser.add_argument('--seed_base', type=str, help='batch mode: base seed for the per test seeds', default=None)
+        parser.add_argument('--profile', action='store_true',
+                            help='write per stage timing, call counts and peak RSS to <output YAML stem>.profile.json')
+        parser.add_argument('--profile_cprofile', action='store_true',
+                            help='--profile plus a cProfile dump in <output YAML stem>.prof')
+        parser.add_argument('--cache', action='store_true',
+                            help='restore the outputs of a --seed test from the output cache instead of running main(). '
+                                 'Also enabled by DATAGEN_CACHE=1')
+        parser.add_argument('--no_cache', '--no-cache', action='store_true',
+                            help='always run main(), do not use or fill the output cache. Overrides DATAGEN_CACHE')
+        parser.add_argument('--cache_dir', type=str, default=None,
+                            help='output cache directory. Default $DATAGEN_CACHE_DIR or ~/.cache/datagenDV')
+        parser.add_argument('--cache_size', type=float, default=1024,
+                            help='output cache size limit in MB, least recently used entries are evicted')
+        parser.add_argument('--cache_link', action='store_true',
+                            help='hard-link cached outputs instead of copying them. Treat the outputs as read-only')
+        parser.add_argument('--serve', type=str, nargs='?', const='-', default=None, metavar='SOCKET',
+                            help='server mode: serve JSON lines requests on stdin/stdout, or on the given Unix socket path. '
+                                 '--jobs sets the number of worker processes')
 
         self.args = parser.parse_args()
+        if self.args.serve is None and (self.args.input_yaml is None or self.args.output_yaml is None):
+            parser.error("input_yaml and output_yaml are required unless --serve is given")
         self.header_path = self.args.header_path
 
         if self.args.seed is not None:
@@ -64,39 +138,705 @@ class DatagenBase():
         Loads input_yaml file into self.suite
         Classes should be specified in YAML with 'DatagenClass' field
         Classes should be registered with self.yaml.register_class before calling
+        In server mode without an input_yaml this does nothing, each request parses its own input
         """
+        if self.args.input_yaml is None and self.args.serve is not None:
+            return
+        self.check_input_yaml()
+
+        with profiler.stage('parse_yaml'):
+            #Open the yaml file into lines and convert DatagenClass fields into yml tags
+            yaml_lines = open(self.args.input_yaml).readlines()
+            yaml_text = "".join(yaml_lines)
+
+            if self.args.count is None:
+                self.yaml_dict = self.yaml.load(yaml_text)
+                if self.args.seed is not None:
+                    seed_objects(self.yaml_dict, self.args.seed)
+            else:
+                #Batch mode keeps the composed nodes so each test only re-runs construction
+                self.yaml_node = self.yaml.compose(yaml_text)
+                self.yaml_dict = self.yaml.constructor.construct_document(self.yaml_node)
+
+
+        # Initialize random number generator
+        # using global suite seed
+
+    def check_input_yaml(self):
         #Check the parameters passed in if they are valid
         if not os.path.isfile(self.args.input_yaml):
             print(f"ERROR: input_yaml is not a valid path {self.args.input_yaml}")
             sys.exit(1)
 
-        #Open the yaml file into lines and convert DatagenClass fields into yml tags
-        yaml_lines = open(self.args.input_yaml).readlines()
-        yaml_text = "".join(yaml_lines)
+    def stream_yaml(self, process):
+        """
+        Streaming alternative to parse_yaml() + write_outputs() for large suites
+        input_yaml is consumed one item at a time: each '---' separated document, or each item
+        of a top-level sequence. Each item is constructed, passed to process(item) and the
+        result (or the item itself if process returns None) is appended to output_yaml straight away
+        Memory is bounded by a single item. Anchors/aliases are only resolved within an item
+        With --seed, the objects of item i are seeded as seed_objects(item, seed, i) does
+        Returns the number of items processed
+        """
+        self.check_input_yaml()
+        count = 0
+        with profiler.stage('stream_yaml'), open(self.args.input_yaml) as input_fp, open(self.args.output_yaml, 'w') as output_yaml_fp:
+            for item, is_sequence_item in self._iter_yaml_items(input_fp):
+                if self.args.seed is not None:
+                    seed_objects(item, self.args.seed, count)
+                result = process(item)
+                self._append_output_item(item if result is None else result, is_sequence_item, output_yaml_fp)
+                count += 1
+        return count
+
+    def _iter_yaml_items(self, stream):
+        """Composes and constructs one document or top-level sequence item at a time"""
+        constructor, parser = self.yaml.get_constructor_parser(stream)
+        if parser is constructor:
+            #C parser (fast engine) composes whole documents only. Attach a python composer to its events
+            parser.max_depth = self.yaml.max_depth
+            composer = Composer(loader=parser)
+        else:
+            composer = self.yaml.composer
+        try:
+            parser.get_event() # STREAM-START
+            while not parser.check_event(StreamEndEvent):
+                parser.get_event() # DOCUMENT-START
+                composer.anchors = {}
+                if parser.check_event(SequenceStartEvent):
+                    parser.get_event()
+                    index = 0
+                    while not parser.check_event(SequenceEndEvent):
+                        yield constructor.construct_document(composer.compose_node(None, index)), True
+                        index += 1
+                    parser.get_event()
+                else:
+                    yield constructor.construct_document(composer.compose_node(None, None)), False
+                parser.get_event() # DOCUMENT-END
+        finally:
+            #Same cleanup as YAML.load_all() so self.yaml can be reused
+            parser.dispose()
+            for comp in ('reader', 'scanner'):
+                try:
+                    getattr(getattr(self.yaml, '_' + comp), f'reset_{comp}')()
+                except AttributeError:
+                    pass
 
-        self.yaml_dict = self.yaml.load(yaml_text)
+    def _append_output_item(self, item, is_sequence_item, output_yaml_fp):
+        if is_sequence_item:
+            #A one item list dumps as a single block sequence entry, so entries concatenate
+            self.yaml.dump([item], output_yaml_fp, transform=self.dump_transform())
+        else:
+            explicit_start = self.yaml.explicit_start
+            self.yaml.explicit_start = True
+            try:
+                self.yaml.dump(item, output_yaml_fp, transform=self.dump_transform())
+            finally:
+                self.yaml.explicit_start = explicit_start
+        output_yaml_fp.flush()
 
+    def run(self):
+        """
+        Runs main() once, once per test when --count is given, or once per request with --serve
+        """
+        assert hasattr(self, 'main'), f"{type(self).__name__} must define main() to be run"
+        if self.args.serve is not None:
+            return self.serve()
+        if self.args.count is None:
+            key = self.cache_key()
+            if key is None:
+                with profiler.stage('main'):
+                    return self.main()
+            return self.run_cached(key)
+        self.run_batch()
 
-        # Initialize random number generator
-        # using global suite seed
+    def output_cache(self):
+        return output_cache.OutputCache(self.args.cache_dir, int(self.args.cache_size * (1 << 20)), self.args.cache_link)
+
+    def cache_enabled(self):
+        """--cache or DATAGEN_CACHE=1, unless --no_cache is given"""
+        if self.args.no_cache:
+            return False
+        return self.args.cache or os.environ.get('DATAGEN_CACHE', '') not in ('', '0')
+
+    def cache_key(self):
+        """
+        Output cache key of this test, None if it is not cached (cache not enabled, no --seed, batch mode or unknown sources)
+        Covers every argument of self.args, including those a subclass adds, except the cache options themselves
+        """
+        if not self.cache_enabled() or self.args.seed is None or self.args.count is not None:
+            return None
+        sources = self.datagen_source_files()
+        if sources is None:
+            return None
+        arguments = {}
+        for name, value in sorted(vars(self.args).items()):
+            if name in _CACHE_OPTIONS:
+                continue
+            if name in ('output_yaml', 'header_path'):
+                value = output_cache.portable_path(value)
+            elif not isinstance(value, (str, int, float, bool, type(None))):
+                value = repr(value)
+            arguments[name] = value
+        return output_cache.cache_key({
+            'input_yaml': output_cache.file_digest(self.args.input_yaml),
+            'args': arguments,
+            'sources': sorted(output_cache.file_digest(source) for source in sources),
+            'library': output_cache.library_version(),
+        })
+
+    def datagen_source_files(self):
+        """
+        Source files defining the datagen script and the classes registered with self.yaml
+        Library modules are covered by the library version. None if a class has no source file (e.g. notebooks)
+        """
+        classes = [type(self)]
+        for constructor in self.yaml.constructor.yaml_constructors.values():
+            if isinstance(getattr(constructor, '__self__', None), type):
+                classes.append(constructor.__self__)
+        library_paths = {os.path.abspath(sysconfig.get_paths()[name]) for name in ('stdlib', 'platstdlib', 'purelib', 'platlib')}
+        sources = set()
+        for cls in classes:
+            for klass in cls.__mro__:
+                module_name = klass.__module__
+                if module_name == 'builtins' or module_name.split('.')[0] == 'datagenDV':
+                    continue
+                filename = getattr(sys.modules.get(module_name), '__file__', None)
+                if filename is None:
+                    return None
+                filename = os.path.abspath(filename)
+                if not any(filename.startswith(path + os.sep) for path in library_paths):
+                    sources.add(filename)
+        return sources
+
+    def run_cached(self, key):
+        """Restores the outputs of key from the cache, or runs main() and caches the outputs it records"""
+        cache = self.output_cache()
+        with profiler.stage('cache_restore'):
+            hit = cache.restore(key)
+        if hit:
+            print(f"INFO: outputs restored from cache {cache.entry_dir(key)}")
+            return None
+        self.cache_outputs = []
+        ctypes_helper._output_recorder = self.record_output
+        try:
+            with profiler.stage('main'):
+                result = self.main()
+        finally:
+            ctypes_helper._output_recorder = None
+        with profiler.stage('cache_store'):
+            if self.cache_outputs and not cache.store(key, self.cache_outputs):
+                print("WARNING: an output file of this test is missing, its outputs are not cached")
+        self.cache_outputs = None
+        return result
+
+    def record_output(self, filename):
+        """Adds a file written by this test to its output cache entry. Does nothing when the test is not cached"""
+        if self.cache_outputs is not None:
+            self.cache_outputs.append(filename)
+
+    def run_batch(self):
+        """
+        Batch mode. Generates --count tests from the already parsed input YAML
+        Each test gets a seed derived from --seed_base (or --seed) and the test index
+        Tests are spread over --jobs forked worker processes
+        """
+        assert hasattr(self, "yaml_node"), "parse_yaml() must be called before run_batch()"
+        seed_base = self.args.seed_base if self.args.seed_base is not None else self.args.seed
+        if seed_base is None:
+            seed_base = str(random.getrandbits(32))
+            print(f"INFO: batch mode using --seed_base {seed_base}")
+        seeds = [derive_seed(seed_base, index) for index in range(self.args.count)]
+        self.batch_output_yaml = self.args.output_yaml
+        #Identifies this batch in the header manifest, set before forking so every worker shares it
+        self.batch_run_id = f"{os.getpid()}-{time.time_ns()}"
+
+        jobs = min(self.args.jobs, self.args.count)
+        if jobs > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            print("WARNING: batch mode requires the fork start method for --jobs > 1. Running serially")
+            jobs = 1
+
+        if jobs <= 1:
+            for index, seed in enumerate(seeds):
+                self.run_batch_test(index, seed)
+            return
+
+        global _worker_datagen
+        _worker_datagen = self
+        try:
+            with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("fork")) as executor:
+                #Iterating the results re-raises any worker exception
+                for profile_report in executor.map(_run_batch_test, range(self.args.count), seeds):
+                    if profile_report is not None:
+                        self.profiler.merge(profile_report)
+        finally:
+            _worker_datagen = None
+
+    def run_batch_test(self, index, seed):
+        """Constructs a fresh yaml_dict from the parsed input and runs main() for test number index"""
+        self.args.seed = str(seed)
+        random.seed(self.args.seed)
+        self.args.output_yaml = self.batch_output_path(index)
+        with profiler.stage('construct_yaml'):
+            self.yaml_dict = self.yaml.constructor.construct_document(self.yaml_node)
+            seed_objects(self.yaml_dict, self.args.seed)
+        with profiler.stage('main'):
+            self.main()
+
+    def serve(self):
+        """
+        Server mode. The registered classes, imports and solver state are loaded once and reused by every request
+        Requests are JSON objects, one per line:
+          {"id": 1, "input_yaml": "in.yml", "output_yaml": "out/params.yml", "seed": "42"}
+        optional keys: header_path, count, seed_base (batch mode inside the request)
+        Requests without a seed key use the server's --seed, "seed": null runs unseeded
+        Each request is answered by one JSON line with the same id:
+          {"id": 1, "ok": true, "output_yaml": "out/params.yml", "seconds": 0.012}
+          {"id": 1, "ok": false, "error": "..."}
+        {"cmd": "ping"} is answered with {"ok": true}, {"cmd": "shutdown"} stops the server
+        With --jobs > 1 requests run concurrently in forked workers and may be answered out of order
+        """
+        jobs = self.args.jobs
+        if jobs > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            print("WARNING: --serve requires the fork start method for --jobs > 1. Serving serially")
+            jobs = 1
+        self.serve_args = self.args
+
+        global _worker_datagen
+        _worker_datagen = self
+        executor = None
+        try:
+            if jobs > 1:
+                executor = ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("fork"))
+                #Fork every worker now, before the server starts any threads
+                executor.submit(_serve_ping).result()
+            handle = self._serve_handler(executor)
+            if self.args.serve == '-':
+                self._serve_stdio(handle)
+            else:
+                self._serve_unix_socket(self.args.serve, handle)
+        finally:
+            if executor is not None:
+                executor.shutdown()
+            _worker_datagen = None
+            self.args = self.serve_args
+
+    def _serve_handler(self, executor):
+        """Returns handle(request, respond) running the request in-process or in the worker pool"""
+        lock = threading.Lock()
+        if executor is None:
+            def handle(request, respond):
+                with lock:
+                    respond(self.serve_request(request))
+            return handle
+
+        def handle(request, respond):
+            try:
+                future = executor.submit(_serve_request, request)
+            except BrokenProcessPool as error:
+                respond(_serve_error(request, f"worker pool is broken: {error}"))
+                return
+            def done(future):
+                try:
+                    response, profile_report = future.result()
+                except BrokenProcessPool as error:
+                    response, profile_report = _serve_error(request, f"worker pool is broken: {error}"), None
+                with lock:
+                    if profile_report is not None and self.profiler is not None:
+                        self.profiler.merge(profile_report)
+                respond(response)
+            future.add_done_callback(done)
+        return handle
+
+    def serve_request(self, request):
+        """
+        Runs one server request in this process and returns its response dict
+        Arguments not given by the request keep their value from the server's command line
+        Output of the datagen script goes to stderr so it can not corrupt the stdout protocol
+        """
+        start = time.perf_counter()
+        self.args = copy.copy(self.serve_args)
+        try:
+            with contextlib.redirect_stdout(sys.stderr), profiler.stage('serve_request'):
+                for key in ('input_yaml', 'output_yaml', 'count', 'seed_base', 'header_path'):
+                    if key in request:
+                        setattr(self.args, key, request[key])
+                if self.args.input_yaml is None or self.args.output_yaml is None:
+                    raise ValueError("request requires input_yaml and output_yaml")
+                if not os.path.isfile(self.args.input_yaml):
+                    raise FileNotFoundError(f"input_yaml is not a valid path {self.args.input_yaml}")
+                output_yaml = self.args.output_yaml
+                if 'seed' in request:
+                    self.args.seed = None if request['seed'] is None else str(request['seed'])
+                self.args.jobs = 1
+                self.args.serve = None
+                self.header_path = self.args.header_path
+                if self.args.seed is not None:
+                    random.seed(self.args.seed)
+                self.parse_yaml()
+                self.run()
+            return {'id': request.get('id'), 'ok': True, 'output_yaml': output_yaml,
+                    'seconds': time.perf_counter() - start}
+        except (Exception, SystemExit) as error:
+            traceback.print_exc(file=sys.stderr)
+            return _serve_error(request, f"{type(error).__name__}: {error}")
+        finally:
+            self.args = self.serve_args
+            self.header_path = self.args.header_path
+            self.__dict__.pop('batch_output_yaml', None)
+            self.__dict__.pop('batch_run_id', None)
+
+    def _serve_stdio(self, handle):
+        #Responses own the real stdout, anything the scripts print is redirected to stderr
+        output = sys.stdout
+        output_lock = threading.Lock()
+        def respond(response):
+            with output_lock:
+                output.write(json.dumps(response) + "\n")
+                output.flush()
+        for line in sys.stdin:
+            request = _parse_serve_request(line, respond)
+            if request is None:
+                continue
+            if request.get('cmd') == 'shutdown':
+                break
+            handle(request, respond)
+
+    def _serve_unix_socket(self, path, handle):
+        if os.path.exists(path):
+            os.unlink(path)
+
+        class RequestHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                output_lock = threading.Lock()
+                def respond(response):
+                    with output_lock:
+                        try:
+                            self.wfile.write((json.dumps(response) + "\n").encode())
+                            self.wfile.flush()
+                        except OSError:
+                            #Client went away
+                            pass
+                pending = []
+                for line in self.rfile:
+                    request = _parse_serve_request(line.decode(), respond)
+                    if request is None:
+                        continue
+                    if request.get('cmd') == 'shutdown':
+                        threading.Thread(target=self.server.shutdown).start()
+                        break
+                    done = threading.Event()
+                    pending.append(done)
+                    handle(request, lambda response, done=done: (respond(response), done.set()))
+                #Answer every request before the connection is closed
+                for done in pending:
+                    done.wait()
+
+        with socketserver.ThreadingUnixStreamServer(path, RequestHandler) as server:
+            server.daemon_threads = True
+            print(f"INFO: serving on {path}", file=sys.stderr)
+            try:
+                server.serve_forever()
+            finally:
+                os.unlink(path)
+
+    def randomize_all(self, jobs=None):
+        """
+        Randomizes every rand_dataclass object of self.yaml_dict (see iter_objects()) in document order
+        jobs > 1 randomizes them in forked worker processes. Workers send back the field values only
+        (randomized_fields()), which are set on the original objects in place, so the ruamel containers
+        keep their ordering and comments. Results are identical for every jobs value
+        jobs defaults to --jobs, and to 1 in batch and server mode, whose tests already run in parallel
+        Returns the number of objects randomized
+        """
+        objs = [obj for _, obj in iter_objects(self.yaml_dict) if getattr(type(obj), '_ro_init', False)]
+        if jobs is None:
+            jobs = self.args.jobs if self.args.count is None and self.args.serve is None else 1
+        jobs = min(jobs, len(objs))
+        if jobs > 1 and "fork" not in multiprocessing.get_all_start_methods():
+            print("WARNING: randomize_all requires the fork start method for jobs > 1. Randomizing serially")
+            jobs = 1
+
+        with profiler.stage('randomize_all'):
+            if jobs <= 1:
+                for obj in objs:
+                    obj.randomize()
+                    #Same follow-up streams as objects randomized by workers
+                    _seed_streams(obj, _next_stream_seed(obj))
+                return len(objs)
+
+            global _worker_objects
+            _worker_objects = objs
+            try:
+                with ProcessPoolExecutor(max_workers=jobs, mp_context=multiprocessing.get_context("fork")) as executor:
+                    chunk_size = max(1, len(objs) // (jobs * 8))
+                    chunks = [range(start, min(start + chunk_size, len(objs))) for start in range(0, len(objs), chunk_size)]
+                    for chunk, results in zip(chunks, executor.map(_randomize_objects, chunks)):
+                        for index, result in zip(chunk, results):
+                            merge_randomized_fields(objs[index], result)
+            finally:
+                _worker_objects = None
+        return len(objs)
+
+    def batch_output_path(self, index):
+        """output_yaml with the test index appended to the file name. out/params.yml -> out/params_3.yml"""
+        root, ext = os.path.splitext(self.batch_output_yaml)
+        return f"{root}_{index}{ext}"
 
     def write_outputs(self, structs = [], enums = [], defines = {} ):
         if structs or enums or defines:
-            with open( os.path.join(self.header_path,"datagen_types.h") , "w") as fh:
-                fh.write(self.datagen_types_header)
-                ctypes_helper.write_defines(fh, defines)
-                ctypes_helper.write_enum_type_defs(fh, enums)
-                ctypes_helper.write_ctype_structs(fh, structs, use_hfields=True)
-                fh.write(self.datagen_types_footer)
+            with profiler.stage('write_header'):
+                self.write_header(structs, enums, defines)
 
         # Dump the updated parameters back out
-        with open(self.args.output_yaml, 'w') as output_yaml_fp:
-            self.yaml.dump(self.yaml_dict,output_yaml_fp, transform=lambda s: s.replace('!', '') )
+        with profiler.stage('write_yaml'), open(self.args.output_yaml, 'w') as output_yaml_fp:
+            self.yaml.dump(self.yaml_dict,output_yaml_fp, transform=self.dump_transform())
+        self.record_output(self.args.output_yaml)
+
+    def write_header(self, structs, enums, defines):
+        """
+        Writes datagen_types.h and its layout manifest datagen_types.manifest.json to header_path
+        The header is only replaced (atomically) when the hash of the existing file's content differs,
+        so an unchanged layout keeps the old mtime and doesn't trigger rebuilds of the C code including it.
+        A missing or stale manifest is rewritten on its own
+        Returns True if the header was rewritten
+        """
+        fh = io.StringIO()
+        fh.write(self.datagen_types_header)
+        ctypes_helper.write_defines(fh, defines)
+        ctypes_helper.write_enum_type_defs(fh, enums)
+        ctypes_helper.write_ctype_structs(fh, structs, use_hfields=True)
+        fh.write(self.datagen_types_footer)
+        header_text = fh.getvalue()
+        sha256 = hashlib.sha256(header_text.encode()).hexdigest()
+
+        header_file = os.path.join(self.header_path, "datagen_types.h")
+        manifest_file = os.path.join(self.header_path, "datagen_types.manifest.json")
+        self.record_output(header_file)
+        self.record_output(manifest_file)
+        manifest = read_manifest(manifest_file)
+        #Only a manifest written by this same batch run shows the layout changed between its tests
+        batch_run = getattr(self, 'batch_run_id', None) if self.args.count is not None else None
+        if manifest.get('sha256') not in (None, sha256) and batch_run is not None and manifest.get('batch_run') == batch_run:
+            print(f"WARNING: {header_file} layout differs between tests of this batch. The header holds the last test's layout")
+
+        rewrite = file_sha256(header_file) != sha256
+        if rewrite:
+            write_file_atomic(header_file, header_text)
+        elif manifest.get('sha256') == sha256 and manifest.get('batch_run') == batch_run:
+            return False
+        manifest = {
+            'sha256': sha256,
+            'batch_run': batch_run,
+            'structs': {struct.__name__: ctypes_helper.ctype_struct_layout(struct) for struct in structs},
+            'enums': {enum_class.__name__: {e.name: e.value for e in enum_class} for enum_class in enums},
+            'defines': {name: str(val) for name, val in defines.items()},
+        }
+        write_file_atomic(manifest_file, json.dumps(manifest, indent=2))
+        return rewrite
+
+    def start_profile(self):
+        """Starts the profiler for --profile. The report is written by write_profile(), at the latest on exit"""
+        self.profiler = profiler.Profiler(use_cprofile=self.args.profile_cprofile).start()
+        atexit.register(self.write_profile)
+
+    def write_profile(self):
+        """Stops the profiler and writes <output YAML stem>.profile.json (and .prof with --profile_cprofile)"""
+        if self.profiler is None:
+            return
+        self.profiler.stop()
+        root = os.path.splitext(getattr(self, 'batch_output_yaml', None) or self.args.output_yaml or 'datagen_serve')[0]
+        self.profiler.write(root + ".profile.json", root + ".prof")
+        print(f"INFO: profile written to {root}.profile.json")
+        self.profiler = None
+
+    def dump_transform(self):
+        """
+        The round-trip engine emits the '!' tag of YAMLParamsBase objects, which is stripped on dump
+        The fast engine's DatagenRepresenter never emits it
+        """
+        if self.yaml_engine == 'fast':
+            return None
+        return lambda s: s.replace('!', '')
+
+YAML_ENGINES = ('rt', 'fast')
+
+def create_yaml(engine='rt'):
+    """
+    Creates the ruamel YAML instance used by DatagenBase
+    rt   - round-trip loader/dumper
+    fast - safe loader/dumper using the C libyaml parser and emitter from ruamel.yaml.clib.
+           Falls back to the pure python safe implementation if the C extension is not installed
+    Both engines load DatagenClass mappings through DatagenConstructor and dump any YAMLParamsBase object
+    """
+    assert engine in YAML_ENGINES, f"Invalid yaml engine '{engine}'"
+    if engine == 'fast':
+        yaml = YAML(typ='safe', pure=False)
+        yaml.Representer = DatagenRepresenter
+        #Match the round-trip output layout: block style, keys in insertion order
+        yaml.default_flow_style = False
+        yaml.sort_base_mapping_type_on_output = False
+    else:
+        yaml = YAML()
+        yaml.Representer = DatagenRoundTripRepresenter
+    yaml.Constructor = DatagenConstructor
+    return yaml
+
+def derive_seed(seed, *path):
+    """
+    Derives a 64 bit child seed from a parent seed and a path of keys/indexes
+    The same seed and path always give the same child seed, independent of the global random state
+    """
+    key = ":".join(str(x) for x in (seed,) + path)
+    return int.from_bytes(hashlib.sha256(key.encode()).digest()[:8], "little")
+
+def iter_objects(node, *path):
+    """
+    Yields (path, obj) for every ParamsBase object found under node (dicts, lists and the fields
+    of other objects) in document order. suite.frames[2] has the path ('suite', 'frames', 2)
+    Objects aliased at several paths are yielded once, with the first path
+    """
+    seen = set()
+    stack = [(node, path)]
+    while stack:
+        node, path = stack.pop()
+        if isinstance(node, dict):
+            items = node.items()
+        elif isinstance(node, list):
+            items = enumerate(node)
+        elif isinstance(node, ParamsBase):
+            if id(node) in seen:
+                continue
+            seen.add(id(node))
+            yield path, node
+            items = [(name, value) for name, value in field_items(node) if not name.startswith('_')]
+        else:
+            continue
+        #Reversed so objects come out in document order
+        stack.extend((value, path + (key,)) for key, value in reversed(list(items))
+                     if isinstance(value, (dict, list, ParamsBase)))
+
+def seed_objects(node, seed, *path):
+    """
+    Seeds every ParamsBase object under node with seed_object(obj, derive_seed(seed, *path to the object))
+    suite.frames[2] gets derive_seed(seed, 'suite', 'frames', 2). Each object then randomizes to the
+    same values whatever the order, process or subset of objects being generated
+    """
+    for obj_path, obj in iter_objects(node, *path):
+        seed_object(obj, derive_seed(seed, *obj_path))
+
+def randomized_fields(obj):
+    """
+    Picklable result of randomizing a rand_dataclass obj: its dataclass field values (rand_ fields as plain
+    values) and a seed for the next use of its random streams, drawn from the streams randomize() advanced
+    Attributes post_randomize sets outside the dataclass fields are not included
+    """
+    fields = {field.name: getattr(obj, field.name) for field in dataclasses.fields(obj)}
+    return fields, _next_stream_seed(obj)
+
+def merge_randomized_fields(obj, result):
+    """Applies randomized_fields() of a copy of obj, randomized in another process, to obj in place"""
+    fields, next_seed = result
+    for name, value in fields.items():
+        setattr(obj, name, value)
+    _seed_streams(obj, next_seed)
+
+def _next_stream_seed(obj):
+    return obj._get_ro_int().get_randstate().rng.getrandbits(64)
+
+def file_sha256(filename):
+    """sha256 hex digest of a file's content, None if it doesn't exist"""
+    try:
+        with open(filename, 'rb') as fh:
+            return hashlib.sha256(fh.read()).hexdigest()
+    except FileNotFoundError:
+        return None
+
+def read_manifest(filename):
+    """Loads a JSON manifest, {} if it is missing or unreadable"""
+    try:
+        with open(filename) as fh:
+            return json.load(fh)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def write_file_atomic(filename, text):
+    """
+    Writes text to a temporary file next to filename and renames it into place
+    Readers and concurrent writers (batch workers, parallel runs) never see a partially written file
+    """
+    tmp_name = f"{filename}.{os.getpid()}.{os.urandom(4).hex()}.tmp"
+    #0o666 is masked by the process umask, the permissions open() would have given the file
+    fd = os.open(tmp_name, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666)
+    try:
+        with os.fdopen(fd, 'w') as fh:
+            fh.write(text)
+        os.replace(tmp_name, filename)
+    except BaseException:
+        os.unlink(tmp_name)
+        raise
+
+#Datagen object used by forked batch and --serve workers. Set for the lifetime of the process pool
+_worker_datagen = None
+
+def _run_batch_test(index, seed):
+    """Runs one test in a worker. Returns the test's profile report when profiling"""
+    if _worker_datagen.profiler is None:
+        _worker_datagen.run_batch_test(index, seed)
+        return None
+    _worker_datagen.profiler.reset()
+    _worker_datagen.run_batch_test(index, seed)
+    return _worker_datagen.profiler.report()
+
+#rand_dataclass objects randomized by forked randomize_all() workers
+_worker_objects = None
+
+def _randomize_objects(indexes):
+    """Randomizes the objects at indexes of _worker_objects in a worker. Returns their randomized_fields()"""
+    results = []
+    for index in indexes:
+        obj = _worker_objects[index]
+        obj.randomize()
+        results.append(randomized_fields(obj))
+    return results
+
+def _serve_ping():
+    return None
+
+def _serve_request(request):
+    """Runs one --serve request in a worker. Returns (response, the request's profile report when profiling)"""
+    if _worker_datagen.profiler is None:
+        return _worker_datagen.serve_request(request), None
+    _worker_datagen.profiler.reset()
+    response = _worker_datagen.serve_request(request)
+    return response, _worker_datagen.profiler.report()
+
+def _serve_error(request, error):
+    return {'id': request.get('id'), 'ok': False, 'error': error}
+
+def _parse_serve_request(line, respond):
+    """Decodes one request line. Answers ping and malformed requests directly and returns None for them"""
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        request = json.loads(line)
+        if not isinstance(request, dict):
+            raise ValueError("request must be a JSON object")
+    except ValueError as error:
+        respond({'id': None, 'ok': False, 'error': f"invalid request: {error}"})
+        return None
+    if request.get('cmd') == 'ping':
+        respond({'id': request.get('id'), 'ok': True})
+        return None
+    return request
 
 class DatagenConstructor(SafeConstructor):
     """ Custom Construtor to treat DatagenClass as a class tag"""
     def construct_object(self, node, deep=False):
         if isinstance(node, MappingNode):
+            if node in self.constructed_objects:
+                return self.constructed_objects[node]
             data = super().construct_mapping(node, deep)
             assert isinstance(data, dict)
             if "DatagenClass" in data:
@@ -105,4 +845,35 @@ class DatagenConstructor(SafeConstructor):
                     f"{data['DatagenClass']} is not registered with yaml loader. Missing register_class({data['DatagenClass']}) or mispelled in yml "
                 #Calls the classes from_yaml
                 return self.yaml_constructors[tag](self, data)
+            if node.tag == 'tag:yaml.org,2002:map':
+                #Plain mappings are fully constructed already. Constructing them again through
+                #SafeConstructor would also construct every child mapping again
+                self.constructed_objects[node] = data
+                return data
         return super().construct_object(node, deep)
+
+class DatagenRepresenter(SafeRepresenter):
+    """
+    Representer used by the fast engine
+    YAMLParamsBase.to_yaml requests the bare '!' tag, which is represented as a plain mapping
+    instead of being emitted and stripped afterwards. None is dumped as an empty value like the round-trip engine
+    """
+    def represent_mapping(self, tag, mapping, flow_style=None):
+        if tag == '!':
+            tag = 'tag:yaml.org,2002:map'
+        return super().represent_mapping(tag, mapping, flow_style=flow_style)
+
+    def represent_none(self, data):
+        return self.represent_scalar('tag:yaml.org,2002:null', '')
+
+DatagenRepresenter.add_representer(type(None), DatagenRepresenter.represent_none)
+
+class DatagenRoundTripRepresenter(RoundTripRepresenter):
+    """Representer used by the round-trip engine"""
+
+def _represent_params(representer, data):
+    """YAMLParamsBase classes dump through their to_yaml without register_class, e.g. to_record() results"""
+    return type(data).to_yaml(representer, data)
+
+DatagenRepresenter.add_multi_representer(YAMLParamsBase, _represent_params)
+DatagenRoundTripRepresenter.add_multi_representer(YAMLParamsBase, _represent_params)
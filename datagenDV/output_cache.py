@@ -0,0 +1,181 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Content-addressed cache of datagen outputs
+With --cache, DatagenBase keys a run by its input YAML, arguments, datagen code and library version. On a hit
+the cached output files are copied (or hard-linked) into place instead of running main()
+Entries are evicted least recently used first once the cache exceeds its size limit
+"""
+import filecmp
+import hashlib
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+ENTRY_FILE = 'entry.json'
+
+
+def default_cache_dir():
+    return os.environ.get('DATAGEN_CACHE_DIR') or os.path.join(os.path.expanduser('~'), '.cache', 'datagenDV')
+
+
+#sha256 of source files keyed by (path, mtime, size)
+_file_digests = {}
+
+def file_digest(filename):
+    """sha256 hex digest of a file, memoized while the file is unchanged"""
+    stat = os.stat(filename)
+    memo_key = (filename, stat.st_mtime_ns, stat.st_size)
+    digest = _file_digests.get(memo_key)
+    if digest is None:
+        with open(filename, 'rb') as fh:
+            digest = _file_digests[memo_key] = hashlib.sha256(fh.read()).hexdigest()
+    return digest
+
+
+def library_version():
+    """Digest of the datagenDV sources and the versions of python and the libraries outputs depend on"""
+    from importlib import metadata
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    parts = [sys.version]
+    for name in sorted(os.listdir(package_dir)):
+        if name.endswith('.py'):
+            parts.append(f"{name}:{file_digest(os.path.join(package_dir, name))}")
+    for distribution in ('pyvsc', 'ruamel.yaml', 'numpy'):
+        try:
+            parts.append(f"{distribution}:{metadata.version(distribution)}")
+        except metadata.PackageNotFoundError:
+            parts.append(f"{distribution}:-")
+    return hashlib.sha256("\n".join(parts).encode()).hexdigest()
+
+
+def cache_key(parts):
+    """Key of a cache entry from a dict of JSON serializable parts"""
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
+def portable_path(filename):
+    """Paths inside the working directory are stored relative to it, so entries restore into another run directory"""
+    if os.path.isabs(filename):
+        relative = os.path.relpath(filename)
+        if not relative.startswith(os.pardir):
+            return relative
+    return os.path.normpath(filename)
+
+
+class OutputCache:
+    """
+    On disk cache of output files. Each entry is a directory named by its key holding the
+    files and entry.json (their output paths and total size). The entry directory mtime is its last use
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=1 << 30, link=False):
+        self.cache_dir = cache_dir or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.link = link
+
+    def entry_dir(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def lookup(self, key):
+        """entry.json of key, None on a miss or an unreadable entry"""
+        try:
+            with open(os.path.join(self.entry_dir(key), ENTRY_FILE)) as fh:
+                return json.load(fh)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def restore(self, key):
+        """Places the files of entry key at their output paths. Returns False on a miss"""
+        entry = self.lookup(key)
+        if entry is None:
+            return False
+        entry_dir = self.entry_dir(key)
+        try:
+            for index, filename in enumerate(entry['files']):
+                directory = os.path.dirname(filename)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._place(os.path.join(entry_dir, str(index)), filename)
+        except FileNotFoundError:
+            #Evicted by a concurrent run
+            return False
+        #Mark as recently used
+        os.utime(entry_dir)
+        return True
+
+    def _place(self, cached, filename):
+        #Identical files are kept, e.g. so an unchanged datagen_types.h keeps its mtime
+        if os.path.isfile(filename) and filecmp.cmp(cached, filename, shallow=False):
+            return
+        #Replace rather than overwrite, a hard-linked output must not write through to the cache
+        if os.path.lexists(filename):
+            os.unlink(filename)
+        if self.link:
+            try:
+                os.link(cached, filename)
+                return
+            except OSError:
+                #Other file system or no hard link support
+                pass
+        shutil.copyfile(cached, filename)
+
+    def store(self, key, files):
+        """Adds the output files under key, then evicts down to max_bytes. Returns False if a file is missing"""
+        files = list(dict.fromkeys(portable_path(filename) for filename in files))
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_dir = tempfile.mkdtemp(dir=self.cache_dir, prefix='.tmp.')
+        try:
+            size = 0
+            for index, filename in enumerate(files):
+                shutil.copyfile(filename, os.path.join(tmp_dir, str(index)))
+                size += os.path.getsize(filename)
+            with open(os.path.join(tmp_dir, ENTRY_FILE), 'w') as fh:
+                json.dump({'files': files, 'size': size, 'created': time.time()}, fh, indent=2)
+            try:
+                os.rename(tmp_dir, self.entry_dir(key))
+                tmp_dir = None
+            except OSError:
+                #Another run stored the same key first
+                pass
+        except FileNotFoundError:
+            return False
+        finally:
+            if tmp_dir is not None:
+                shutil.rmtree(tmp_dir, ignore_errors=True)
+        self.evict()
+        return True
+
+    def entries(self):
+        """(last use, size, key) of every entry"""
+        entries = []
+        if not os.path.isdir(self.cache_dir):
+            return entries
+        for key in os.listdir(self.cache_dir):
+            entry = self.lookup(key)
+            if entry is None:
+                continue
+            try:
+                last_use = os.stat(self.entry_dir(key)).st_mtime
+            except FileNotFoundError:
+                continue
+            entries.append((last_use, entry['size'], key))
+        return entries
+
+    def evict(self):
+        """Removes least recently used entries until the cache fits in max_bytes. Returns the number removed"""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, key in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self.entry_dir(key), ignore_errors=True)
+            total -= size
+            removed += 1
+        return removed
@@ -6,15 +6,86 @@ Copyright (c) Microsoft Corporation.
 Author: jonathan.george@microsoft.com
 """
 import dataclasses
+import collections
+import contextlib
 from enum import Enum
-from datagenDV.ctypes_helper import python2ctype, ctype2python
 
 
+#Nesting depth of skip_validation(). Type checks are skipped while it is non-zero
+_skip_validation_depth = 0
+
+@contextlib.contextmanager
+def skip_validation():
+    """
+    Context manager for trusted inputs, e.g. reloading previously generated outputs
+    ParamsBase objects constructed inside it skip the dataclass type checks. Enum strings are still converted
+    """
+    global _skip_validation_depth
+    _skip_validation_depth += 1
+    try:
+        yield
+    finally:
+        _skip_validation_depth -= 1
+
+
+def seed_object(obj, seed):
+    """
+    Gives obj random streams of its own derived from seed, independent of every other object
+    Sets the pyvsc random state of rand_dataclass objects, and python's random module is seeded from
+    the object's stream while it randomizes. obj._seed_ holds the seed for the datagen script
+    Slotted objects have nothing to randomize and no room for _seed_, they are left as they are
+    """
+    if not hasattr(obj, '__dict__'):
+        return
+    obj._seed_ = seed
+    _seed_streams(obj, seed)
+
+
+def _seed_streams(obj, seed):
+    if hasattr(obj, 'set_randstate'):
+        #Only rand_dataclass objects have it, so pyvsc is already imported
+        from vsc.model.rand_state import RandState
+        obj.set_randstate(RandState.mkFromSeed(seed))
+    #python's random is only seeded from it when a rand_dataclass object randomizes
+    obj._random_seed_ = seed
+
+
+class _SlotVars:
+    """Read-only stand-in for vars(obj) of slotted objects, as used by the validators"""
+    __slots__ = ('obj',)
+
+    def __init__(self, obj):
+        self.obj = obj
+
+    def __contains__(self, name):
+        return hasattr(self.obj, name)
+
+    def __getitem__(self, name):
+        return getattr(self.obj, name)
+
+
+def field_items(obj):
+    """
+    (name, value) pairs of an object's instance attributes, like vars(obj).items()
+    Slotted dataclasses (dataclass(slots=True)) have no __dict__, their dataclass fields are used instead
+    """
+    instance_vars = getattr(obj, '__dict__', None)
+    if instance_vars is not None:
+        return instance_vars.items()
+    return [(field.name, getattr(obj, field.name)) for field in dataclasses.fields(obj)]
+
+
+ValidationPlan = collections.namedtuple('ValidationPlan', ['validators', 'trusted_validators'])
+#Compiled validation plans keyed by class
+_validation_plans = {}
+
 class ParamsBase():
     """
     Base command class for datagen parameter classes
     Using Python Dataclasses is recommended
+    Subclasses may opt into dataclass(slots=True) (and frozen=True) for a compact, __dict__ free layout
     """
+    __slots__ = ()
     
     def __post_init__(self):
         """
@@ -22,28 +93,31 @@ class ParamsBase():
         Post init function for subclasses which use dataclasses to call
         Converts enum parameters from strings to their appropriate type
         Adds type checks for dataclasses fields
+        Runs the validators compiled once per class by compile_validation_plan()
         """
-        if not dataclasses.is_dataclass(self):
-            return
-        for field in dataclasses.fields(self):
-            #Ensure that all dataclass fields show up in vars
-            if field.name not in vars(self):
-                setattr(self, field.name, getattr(self, field.name))
-            if field.type is Ellipsis:
-                continue
-            value = getattr(self, field.name)
-            #Convert Enums types from string to their enum value
-            if issubclass(field.type, Enum) and isinstance(value,str):
-                setattr(self, field.name, field.type[value])
-            #Check other types for match
-            elif not isinstance(value, field.type) and value is not None:
-                if field.type in ctype2python:
-                    if not isinstance(value,ctype2python[field.type]):
-                        raise ValueError(f'{type(self)} : Expected {field.name} with ctype {field.type} to be {ctype2python[field.type]}, '
-                                    f'got {type(value)}')
-                else:
-                    raise ValueError(f'{type(self)} : Expected {field.name} to be {field.type}, '
-                                    f'got {type(value)}')
+        plan = _validation_plans.get(type(self))
+        if plan is None:
+            plan = type(self).compile_validation_plan()
+        instance_vars = getattr(self, '__dict__', None)
+        if instance_vars is None:
+            instance_vars = _SlotVars(self)
+        for validator in (plan.trusted_validators if _skip_validation_depth else plan.validators):
+            validator(self, instance_vars)
+
+    @classmethod
+    def compile_validation_plan(cls):
+        """
+        Builds and caches the validation plan of cls, one validator per dataclass field
+        trusted_validators only convert enum strings and are used inside skip_validation()
+        """
+        validators = []
+        trusted_validators = []
+        if dataclasses.is_dataclass(cls):
+            for field in dataclasses.fields(cls):
+                validators.append(_compile_field_validator(field, type_check=True))
+                trusted_validators.append(_compile_field_validator(field, type_check=False))
+        plan = _validation_plans[cls] = ValidationPlan(tuple(validators), tuple(trusted_validators))
+        return plan
     
     #################################
     #C Header file generation functions
@@ -75,6 +149,9 @@ class ParamsBase():
             else:
                 ctype = cls.ctype_field_lookup(field.type)
                 cls._hfields_.append( (field.name, ctype) )
+        #Cached ctypes layouts may have been built from the previous _hfields_
+        from datagenDV.ctypes_helper import clear_ctype_class_cache
+        clear_ctype_class_cache()
 
 
     @classmethod
@@ -82,8 +159,62 @@ class ParamsBase():
         """Looks up the given field type and tries to lookup the appropriate ctype for it"""
         if issubclass(field_type,(ParamsBase,Enum)):
             return field_type
+        from datagenDV.ctypes_helper import python2ctype, ctype2python
         if field_type in python2ctype:
             return python2ctype[field_type]
         if field_type in ctype2python:
             return field_type
         assert False, f"Failed to lookup the field_type for {field_type}. see ctypes_helper.py for supported types"
+
+
+def _compile_field_validator(field, type_check):
+    """Returns a validator(obj, instance_vars) for one dataclass field"""
+    name = field.name
+    field_type = field.type
+
+    def field_value(obj, instance_vars):
+        if name in instance_vars:
+            return instance_vars[name]
+        #Ensure that all dataclass fields show up in vars
+        value = getattr(obj, name)
+        setattr(obj, name, value)
+        return value
+
+    if field_type is Ellipsis:
+        def validate_untyped(obj, instance_vars):
+            if name not in instance_vars:
+                field_value(obj, instance_vars)
+        return validate_untyped
+
+    #Convert Enums types from string to their enum value
+    if issubclass(field_type, Enum):
+        def validate_enum(obj, instance_vars):
+            value = instance_vars[name] if name in instance_vars else field_value(obj, instance_vars)
+            if isinstance(value, str):
+                #object.__setattr__ also converts fields of frozen dataclasses
+                object.__setattr__(obj, name, field_type[value])
+            elif type_check and not isinstance(value, field_type) and value is not None:
+                raise ValueError(f'{type(obj)} : Expected {name} to be {field_type}, '
+                                f'got {type(value)}')
+        return validate_enum
+
+    if not type_check:
+        def validate_trusted(obj, instance_vars):
+            if name not in instance_vars:
+                field_value(obj, instance_vars)
+        return validate_trusted
+
+    #Check other types for match. Python type first as it is the common case for ctype fields
+    from datagenDV.ctypes_helper import ctype2python
+    if field_type in ctype2python:
+        accepted_types = (ctype2python[field_type], field_type)
+        expected = f'Expected {name} with ctype {field_type} to be {ctype2python[field_type]}, '
+    else:
+        accepted_types = field_type
+        expected = f'Expected {name} to be {field_type}, '
+
+    def validate(obj, instance_vars):
+        value = instance_vars[name] if name in instance_vars else field_value(obj, instance_vars)
+        if not isinstance(value, accepted_types) and value is not None:
+            raise ValueError(f'{type(obj)} : {expected}got {type(value)}')
+    return validate
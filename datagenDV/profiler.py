@@ -0,0 +1,204 @@
+"""
+MIT License
+
+Copyright (c) Microsoft Corporation.
+
+Per stage and per DatagenClass profiling of datagen runs
+Enabled by DatagenBase --profile. Records wall time, call counts and peak RSS
+and writes them as JSON, optionally with a cProfile dump
+"""
+import contextlib
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    #Not available on Windows. Peak RSS is reported as null
+    resource = None
+
+#Active Profiler, None when profiling is off
+_profiler = None
+
+_null_stage = contextlib.nullcontext()
+
+
+def peak_rss_kb():
+    """Peak resident set size of this process in KiB, None where unsupported"""
+    if resource is None:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    #macOS reports bytes, Linux KiB
+    return rss // 1024 if sys.platform == 'darwin' else rss
+
+
+def stage(name, class_name=None):
+    """
+    Context manager timing a stage of the active profiler. Does nothing when profiling is off
+    class_name also attributes the time to that DatagenClass
+    """
+    if _profiler is None:
+        return _null_stage
+    return _profiler.stage(name, class_name)
+
+
+def active_profiler():
+    return _profiler
+
+
+class Profiler:
+    """
+    Collects per stage and per class statistics
+
+    Coarse stages (parse_yaml, main, write_yaml, write_header, write_binary, randomize ...)
+    use stage(). Per object hooks (ParamsBase.__post_init__, YAMLParamsBase.from_yaml/to_yaml)
+    are wrapped while the profiler is started, so they cost nothing when profiling is off
+    Times are inclusive: a stage includes the stages nested in it
+    """
+
+    def __init__(self, use_cprofile=False):
+        self.stages = {}  # stage -> [calls, seconds, peak_rss_kb]
+        self.classes = {}  # class name -> {stage -> [calls, seconds]}
+        self.cprofile = None
+        if use_cprofile:
+            import cProfile
+            self.cprofile = cProfile.Profile()
+        self.start_time = None
+        self.seconds = 0.0
+        self.worker_peak_rss_kb = None
+        self._patched = []
+
+    def record(self, name, seconds, class_name=None, rss=None):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = [0, 0.0, None]
+        entry[0] += 1
+        entry[1] += seconds
+        if rss is not None and (entry[2] is None or rss > entry[2]):
+            entry[2] = rss
+        if class_name is not None:
+            class_stages = self.classes.setdefault(class_name, {})
+            class_entry = class_stages.get(name)
+            if class_entry is None:
+                class_entry = class_stages[name] = [0, 0.0]
+            class_entry[0] += 1
+            class_entry[1] += seconds
+
+    @contextlib.contextmanager
+    def stage(self, name, class_name=None):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(name, time.perf_counter() - start, class_name, peak_rss_kb())
+
+    def start(self):
+        global _profiler
+        assert _profiler is None, "Another profiler is already active"
+        _profiler = self
+        self._patch_object_hooks()
+        self.start_time = time.perf_counter()
+        if self.cprofile is not None:
+            self.cprofile.enable()
+        return self
+
+    def stop(self):
+        global _profiler
+        if _profiler is not self:
+            return
+        if self.cprofile is not None:
+            self.cprofile.disable()
+        self.seconds += time.perf_counter() - self.start_time
+        for owner, attr, original in reversed(self._patched):
+            setattr(owner, attr, original)
+        self._patched = []
+        _profiler = None
+
+    def reset(self):
+        """Clears the collected statistics, keeps the profiler running"""
+        self.stages = {}
+        self.classes = {}
+        self.seconds = 0.0
+        self.start_time = time.perf_counter()
+
+    def _patch(self, owner, attr, wrapper):
+        self._patched.append((owner, attr, owner.__dict__[attr]))
+        setattr(owner, attr, wrapper)
+
+    def _patch_object_hooks(self):
+        #Imported here, the datagenDV modules import this one
+        from datagenDV.params_base import ParamsBase
+        from datagenDV.yaml_params_base import YAMLParamsBase
+        record = self.record
+        perf_counter = time.perf_counter
+
+        post_init = ParamsBase.__post_init__
+        def profiled_post_init(obj):
+            start = perf_counter()
+            try:
+                post_init(obj)
+            finally:
+                record('post_init', perf_counter() - start, type(obj).__name__)
+
+        from_yaml = YAMLParamsBase.__dict__['from_yaml'].__func__
+        def profiled_from_yaml(cls, loader, node):
+            start = perf_counter()
+            try:
+                return from_yaml(cls, loader, node)
+            finally:
+                record('construct', perf_counter() - start, cls.__name__)
+
+        to_yaml = YAMLParamsBase.__dict__['to_yaml'].__func__
+        def profiled_to_yaml(cls, dumper, data):
+            start = perf_counter()
+            try:
+                return to_yaml(cls, dumper, data)
+            finally:
+                record('to_yaml', perf_counter() - start, type(data).__name__)
+
+        self._patch(ParamsBase, '__post_init__', profiled_post_init)
+        self._patch(YAMLParamsBase, 'from_yaml', classmethod(profiled_from_yaml))
+        self._patch(YAMLParamsBase, 'to_yaml', classmethod(profiled_to_yaml))
+
+    def report(self):
+        """Statistics as a JSON serializable dict"""
+        seconds = self.seconds
+        if _profiler is self:
+            seconds += time.perf_counter() - self.start_time
+        return {
+            'seconds': seconds,
+            'peak_rss_kb': peak_rss_kb(),
+            'worker_peak_rss_kb': self.worker_peak_rss_kb,
+            'stages': {name: {'calls': calls, 'seconds': secs, 'peak_rss_kb': rss}
+                       for name, (calls, secs, rss) in self.stages.items()},
+            'classes': {class_name: {name: {'calls': calls, 'seconds': secs}
+                                     for name, (calls, secs) in class_stages.items()}
+                        for class_name, class_stages in self.classes.items()},
+        }
+
+    def merge(self, report):
+        """Adds a report() from another process, e.g. a batch worker. Peak RSS is the maximum of both"""
+        for name, entry in report['stages'].items():
+            own = self.stages.setdefault(name, [0, 0.0, None])
+            own[0] += entry['calls']
+            own[1] += entry['seconds']
+            if entry['peak_rss_kb'] is not None and (own[2] is None or entry['peak_rss_kb'] > own[2]):
+                own[2] = entry['peak_rss_kb']
+        for class_name, class_stages in report['classes'].items():
+            own_stages = self.classes.setdefault(class_name, {})
+            for name, entry in class_stages.items():
+                own = own_stages.setdefault(name, [0, 0.0])
+                own[0] += entry['calls']
+                own[1] += entry['seconds']
+        if report['peak_rss_kb'] is not None:
+            self.worker_peak_rss_kb = max(self.worker_peak_rss_kb or 0, report['peak_rss_kb'])
+
+    def write(self, filename, cprofile_filename=None):
+        """Writes report() as JSON to filename, and the cProfile stats to cprofile_filename"""
+        report = self.report()
+        if self.cprofile is not None and cprofile_filename is not None:
+            self.cprofile.dump_stats(cprofile_filename)
+            report['cprofile'] = cprofile_filename
+        with open(filename, 'w') as fh:
+            json.dump(report, fh, indent=2)
@@ -9,8 +9,26 @@ Decorator and helper function for pyvsc yaml params classes
 
 """
 import vsc
-from vsc import constraint
+from vsc import constraint, RandState
+from vsc.model import (BinExprType, ConstraintExprModel, ExprBinModel, ExprFieldRefModel, ExprInModel,
+                       ExprLiteralModel, ExprRangeModel, FieldScalarModel, SolveFailure)
+from vsc.model.enum_field_model import EnumFieldModel
+from vsc.model.constraint_dist_model import ConstraintDistModel
+#Solver internals reused by the solver cache, vsc's randomize() runs the same steps on every call
+from vsc.model.randomizer import Randomizer
+from vsc.model.rand_info_builder import RandInfoBuilder
+from vsc.visitors.clear_soft_priority_visitor import ClearSoftPriorityVisitor
+from vsc.visitors.variable_bound_visitor import VariableBoundVisitor
+import vsc.rand_obj
+from datagenDV import profiler
+from datagenDV.params_base import skip_validation
+from datagenDV.yaml_params_base import YAMLParamsBase
 import dataclasses
+import random
+import sys
+import inspect
+import contextlib
+from collections import namedtuple, OrderedDict
 from copy import copy
 
 #Deprecated
@@ -40,8 +58,65 @@ def rand_dataclass(cls):
     cls = dataclasses.dataclass(cls)
     cls = rand_YML_override(cls)
     cls = vsc.randobj(cls)
+    cls = _add_solver_cache(cls)
+    cls.to_record = to_record
     return cls
 
+#Record classes keyed by rand_dataclass class
+_record_classes = {}
+
+class _SourceHfields:
+    """_hfields_ of a record class, read from its rand_dataclass on each use so generate_hfields() may run later"""
+    def __init__(self, cls):
+        self.cls = cls
+
+    def __get__(self, obj, owner):
+        return self.cls._hfields_
+
+def record_class(cls):
+    """
+    Frozen, slotted dataclass holding the non-rand fields of rand_dataclass cls, named <cls>Record
+    It has none of the pyvsc machinery (rand_ shadow fields, field model, random state) and no __dict__,
+    dumps like cls through to_yaml, and shares cls's _hfields_ binary layout. Built once per class
+    Fields keep their init, repr and metadata, so out only and in only fields behave as on cls
+    """
+    record_cls = _record_classes.get(cls)
+    if record_cls is None:
+        fields = [(field.name, field.type, dataclasses.field(default=None, init=field.init, repr=field.repr,
+                                                             metadata=field.metadata))
+                  for field in dataclasses.fields(cls) if not field.name.startswith('rand_')]
+        #Not a module attribute, pickled (e.g. to batch workers) by rebuilding it from cls
+        def __reduce__(record):
+            return _unpickle_record, (cls, tuple(getattr(record, name) for name in record.__dataclass_fields__))
+        record_cls = dataclasses.make_dataclass(f"{cls.__name__}Record", fields, bases=(YAMLParamsBase,),
+                                                namespace={'__module__': cls.__module__, '__reduce__': __reduce__,
+                                                           '_hfields_': _SourceHfields(cls)},
+                                                frozen=True, slots=True)
+        record_cls._init_fields_ = tuple(name for name, _, field in fields if field.init)
+        record_cls._set_fields_ = tuple(name for name, _, field in fields if not field.init)
+        _record_classes[cls] = record_cls
+    return record_cls
+
+def _make_record(record_cls, values):
+    """record_cls instance from a {field name: value} dict, fields excluded from __init__ are set afterwards"""
+    with skip_validation():
+        record = record_cls(**{name: values[name] for name in record_cls._init_fields_})
+    for name in record_cls._set_fields_:
+        object.__setattr__(record, name, values[name])
+    return record
+
+def _unpickle_record(cls, values):
+    record_cls = record_class(cls)
+    return _make_record(record_cls, dict(zip(record_cls.__dataclass_fields__, values)))
+
+def to_record(obj):
+    """
+    Returns the randomized values of a rand_dataclass object as an immutable record_class() instance
+    Holding records instead of the pyvsc objects cuts the memory per object several times once randomization is done
+    """
+    record_cls = record_class(type(obj))
+    return _make_record(record_cls, {name: getattr(obj, name) for name in record_cls.__dataclass_fields__})
+
 #Deprecated
 def rand_dataclass_seperate(cls):
   cls = dataclasses.dataclass(cls)
@@ -49,6 +124,29 @@ def rand_dataclass_seperate(cls):
   cls = vsc.randobj(cls)
   return cls
 
+def rand_field_table(cls):
+    """
+    (rand attr, non_rand attr, cast type) of each rand_ field of dataclass cls
+    Built once per class and stored as cls._rand_fields_, it drives yaml_input_constraints and post_randomize
+    """
+    table = cls.__dict__.get('_rand_fields_')
+    if table is None:
+        assert(dataclasses.is_dataclass(cls)), \
+            "This function requires the subclass usees dataclass fields to provide typehints"
+        fields = {field.name: field for field in dataclasses.fields(cls)}
+        table = []
+        for rand_name in fields:
+            if not rand_name.startswith('rand_'):
+                continue
+            name = rand_name[len('rand_'):]
+            assert name in fields, \
+                f"Missing {name} field in {cls}. \n\
+                This base class expects that random fields are prefixed with rand_ and suffix matches with a non_randomized field"
+            table.append((rand_name, name, fields[name].type))
+        table = tuple(table)
+        cls._rand_fields_ = table
+    return table
+
 def rand_YML_override(cls):
     """
     rand_YML_override is a class decorator
@@ -64,33 +162,24 @@ def rand_YML_override(cls):
         """
         Constrains each rand_ field to the "non_rand" field
         """
-        for rand_field_name in [field_name for field_name in vars(self).keys() if field_name.startswith('rand_')]:
-            rand_field = getattr(self, rand_field_name)
-            non_rand_field = getattr(self, rand_field_name.split('rand_')[1])
+        for rand_name, name, _ in rand_field_table(type(self)):
+            non_rand_field = getattr(self, name)
             if non_rand_field is not None:
-                rand_field == non_rand_field
+                getattr(self, rand_name) == non_rand_field
 
     def post_randomize(self):
         """
         For each rand_ field, we copy back the values after completing the randomization
         As part of this, we cast the values back to their denoted types using the dataclass typehints
         """
-        assert(dataclasses.is_dataclass(self)), \
-            "This function requires the subclass usees dataclass fields to provide typehints"
-        for rand_field_name in [field_name for field_name in vars(self).keys() if field_name.startswith('rand_')]:
-            non_rand_name = rand_field_name.split('rand_')[1]
-            assert non_rand_name in vars(self).keys(), \
-                f"Missing {non_rand_name} field in {type(self)}. \n\
-                This base class expects that random fields are prefixed with rand_ and suffix matches with a non_randomized field"
-            non_rand_field_val = getattr(self, non_rand_name)
-            if non_rand_field_val is None:
-                rand_field_val = getattr(self, rand_field_name)
-                non_rand_type = [field.type for field in dataclasses.fields(self) if field.name == non_rand_name][0]
-                assert non_rand_type is not Ellipsis, \
-                    f"{non_rand_name} must provide field type via the dataclass field to cast to non_rand "
-                casted_val = non_rand_type(rand_field_val)
-                setattr(self, non_rand_name, casted_val)
+        for rand_name, name, cast_type in rand_field_table(type(self)):
+            if getattr(self, name) is None:
+                assert cast_type is not Ellipsis, \
+                    f"{name} must provide field type via the dataclass field to cast to non_rand "
+                setattr(self, name, cast_type(getattr(self, rand_name)))
 
+    if dataclasses.is_dataclass(cls):
+        rand_field_table(cls)
     setattr(cls, 'yaml_input_constraints', yaml_input_constraints)
 
     #Handles calling user class implementation of post_randomize before the decorator's
@@ -102,4 +191,435 @@ def rand_YML_override(cls):
         setattr(cls, 'post_randomize', post_randomize_final)
     else:
         setattr(cls, 'post_randomize', post_randomize)
-    return cls
\ No newline at end of file
+    return cls
+
+
+SolverCacheInfo = namedtuple('SolverCacheInfo', ['hits', 'misses', 'maxsize', 'currsize'])
+
+#Pyvsc model of a private object per cache key, analyzed once and solved with the randstate of each object
+_SolverModel = namedtuple('_SolverModel', ['model', 'bound_m', 'rand_info'])
+
+_solver_cache = None
+_solver_cache_maxsize = 0
+_solver_cache_hits = 0
+_solver_cache_misses = 0
+
+def enable_solver_cache(enabled=True, maxsize=4096):
+    """
+    Enables (or disables) memoization of constraint models across randomize() calls of rand_dataclass objects
+
+    Entries are keyed by the class plus the pinned non-rand values. The first object of a key
+    builds a pyvsc model with its bounds and rand sets. Later objects with the same key are
+    solved by pyvsc on that model with their own random state, so values match the uncached randomize()
+    Classes with pre_randomize, dist constraints or nested objects are always solved uncached,
+    and so are objects with a field rand_mode or a constraint_mode turned off
+    """
+    global _solver_cache, _solver_cache_maxsize
+    _solver_cache = OrderedDict() if enabled else None
+    _solver_cache_maxsize = maxsize
+    clear_solver_cache()
+
+def clear_solver_cache():
+    """Drops cached entries and resets the hit/miss counters"""
+    global _solver_cache_hits, _solver_cache_misses
+    _solver_cache_hits = _solver_cache_misses = 0
+    if _solver_cache is not None:
+        _solver_cache.clear()
+
+def solver_cache_info():
+    """Returns the solver cache statistics as SolverCacheInfo(hits, misses, maxsize, currsize)"""
+    currsize = len(_solver_cache) if _solver_cache is not None else 0
+    return SolverCacheInfo(_solver_cache_hits, _solver_cache_misses, _solver_cache_maxsize, currsize)
+
+def _solver_cache_key(obj, model):
+    """Class, values pinned by yaml_input_constraints and the init field values without a rand_ field"""
+    pins = tuple((c.e.lhs.fm.idx, int(c.e.rhs.val()))
+                 for block in model.constraint_model_l if block.name == 'yaml_input_constraints'
+                 for c in block.constraint_l)
+    values = tuple(tuple(value) if type(value) is list else value
+                   for value in map(obj.__getattribute__, type(obj)._solver_cache_fields_))
+    return (type(obj), pins, values)
+
+def _cached_solver_model(obj):
+    """Looks up (or builds and stores) the solver model for obj's key, None if obj must be solved uncached"""
+    global _solver_cache_hits, _solver_cache_misses
+    model = obj.get_model()
+    #Cached models have every field rand and every constraint block on, objects that changed a mode solve uncached
+    if not all(field_model.rand_mode for field_model in model.field_l) or \
+            not all(block.enabled for block in model.constraint_model_l):
+        _solver_cache_misses += 1
+        return None
+    key = _solver_cache_key(obj, model)
+    try:
+        solver_model = _solver_cache[key]
+    except KeyError:
+        pass
+    except TypeError:
+        # Unhashable field values
+        _solver_cache_misses += 1
+        return None
+    else:
+        _solver_cache_hits += 1
+        _solver_cache.move_to_end(key)
+        return solver_model
+
+    _solver_cache_misses += 1
+    solver_model = _build_solver_model(obj, model)
+    _solver_cache[key] = solver_model
+    if len(_solver_cache) > _solver_cache_maxsize:
+        _solver_cache.popitem(last=False)
+    return solver_model
+
+def _build_solver_model(obj, model):
+    """
+    Runs the model analysis of pyvsc's Randomizer.do_randomize once, on a private object
+    constructed with obj's init field values. Returns None for models whose analysis
+    depends on the random state (dist) or on user hooks (pre_randomize, nested objects)
+    """
+    if hasattr(obj, 'pre_randomize'):
+        return None
+    if any(type(field_model) not in (FieldScalarModel, EnumFieldModel) for field_model in model.field_l):
+        return None
+    if any(type(c) is ConstraintDistModel for block in model.constraint_model_l for c in block.constraint_l):
+        return None
+    cls = type(obj)
+    #yaml_input_constraints were elaborated when obj was constructed, later assignments don't pin a field
+    pinned = {c.e.lhs.fm.name for block in model.constraint_model_l if block.name == 'yaml_input_constraints'
+              for c in block.constraint_l}
+    values = {name: getattr(obj, name) if rand_name in pinned else None for rand_name, name, _ in rand_field_table(cls)}
+    values.update((name, copy(getattr(obj, name))) for name in cls._solver_cache_fields_)
+    template = cls(**values)
+    template_model = template.get_model()
+    template_model.set_used_rand(True, 0)
+    ClearSoftPriorityVisitor().clear(template_model)
+    bounds_v = VariableBoundVisitor()
+    bounds_v.process([template_model], [], False)
+    bounds_v.process([template_model], [])
+    rand_info = RandInfoBuilder.build([template_model], [], Randomizer._rng)
+    return _SolverModel(template_model, bounds_v.bound_m, rand_info)
+
+def _solve_cached(obj, solver_model, lint, solve_fail_debug):
+    """Solves solver_model with obj's randstate and copies the values into obj's model"""
+    model = solver_model.model
+    model.set_used_rand(True, 0)
+    randomizer = Randomizer(obj._get_ro_int().get_randstate(), lint=lint, solve_fail_debug=solve_fail_debug)
+    try:
+        randomizer.randomize(solver_model.rand_info, solver_model.bound_m)
+    except SolveFailure as e:
+        print(e.diagnostics)
+        raise e
+    for field_model, value_model in zip(obj.get_model().field_l, model.field_l):
+        if field_model.is_declared_rand and field_model.rand_mode:
+            field_model.set_val(value_model.get_val())
+    obj.post_randomize()
+
+def _add_solver_cache(cls):
+    """
+    Routes randomize() of a rand_dataclass class through the solver cache when it's enabled
+    and through the object's own python random stream once seed_object() seeded it
+    """
+    vsc_randomize = cls.randomize
+    rand_names = {name for _, name, _ in rand_field_table(cls)}
+    cls._solver_cache_fields_ = tuple(field.name for field in dataclasses.fields(cls)
+                                      if field.init and field.name not in rand_names)
+
+    def cached_randomize(self, debug, lint, solve_fail_debug):
+        solver_model = _cached_solver_model(self) if _solver_cache is not None and not debug else None
+        if solver_model is None:
+            return vsc_randomize(self, debug=debug, lint=lint, solve_fail_debug=solve_fail_debug)
+        _solve_cached(self, solver_model, lint, solve_fail_debug)
+
+    def randomize(self, debug=0, lint=0, solve_fail_debug=0):
+        with profiler.stage('randomize', type(self).__name__):
+            random_seed = self.__dict__.get('_random_seed_')
+            if random_seed is None:
+                return cached_randomize(self, debug, lint, solve_fail_debug)
+            #Objects seeded by seed_object() run pre/post_randomize with python's random on their own stream
+            #The stream continues from a seed drawn at the end, so objects only keep an int
+            saved_state = random.getstate()
+            random.seed(f"{random_seed} : random")
+            try:
+                return cached_randomize(self, debug, lint, solve_fail_debug)
+            finally:
+                self._random_seed_ = random.getrandbits(64)
+                random.setstate(saved_state)
+
+    cls.randomize = randomize
+    return cls
+
+
+def randomize_many(cls, n, seed=None, as_array=False, **field_values):
+    """
+    Creates and randomizes n objects of a rand_dataclass class
+
+    Fields whose constraints are independent ranges/values (inside, rangelist,
+    comparisons against constants), dist weights or enum domains are drawn in
+    bulk with numpy instead of calling the pyvsc solver per object.
+    Classes with cross-field or other constraints fall back to per-object randomize()
+
+    field_values are passed to every object's constructor, pinning those fields
+    seed makes the results reproducible. If None, the seed is drawn from python's random
+    Returns a list of instances, or a numpy structured array with one column per
+    randomized field when as_array is True. post_randomize is only run for instances
+    """
+    with _vsc_fast_source_info():
+        return _randomize_many(cls, n, seed, as_array, field_values)
+
+def _randomize_many(cls, n, seed, as_array, field_values):
+    import numpy as np
+    if seed is None:
+        seed = random.getrandbits(64)
+    prototype = cls(**field_values)
+    sampler = _bulk_sampler(prototype)
+    if sampler is None:
+        objs = _solver_randomize_many(cls, n, seed, field_values)
+        return _objs_to_array(objs, prototype) if as_array else objs
+
+    rng = np.random.default_rng(seed)
+    columns = [(field_model, _sample_buckets(rng, buckets, n, field_model.is_signed))
+               for field_model, buckets in sampler]
+    if as_array:
+        array = np.empty(n, dtype=_array_dtype(prototype))
+        for field_model, column in columns:
+            array[_array_field_name(field_model)] = column
+        return array
+
+    objs = [prototype] + [cls(**field_values) for _ in range(n-1)] if n else []
+    columns = [(field_model.idx, column.tolist()) for field_model, column in columns]
+    for i, obj in enumerate(objs):
+        field_l = obj.get_model().field_l
+        for idx, column in columns:
+            field_l[idx].set_val(column[i])
+        obj.post_randomize()
+    return objs
+
+_FrameInfo = namedtuple('_FrameInfo', ['filename', 'lineno'])
+
+
+class _FastInspect:
+    """
+    Stand-in for the inspect module used by vsc.rand_obj
+    pyvsc only reads filename/lineno of inspect.stack()[1], but inspect.stack()
+    reads the source of every frame on the stack, which dominates object construction
+    """
+    def stack(self):
+        caller = sys._getframe(1)
+        return [_FrameInfo(caller.f_code.co_filename, caller.f_lineno),
+                _FrameInfo(caller.f_back.f_code.co_filename, caller.f_back.f_lineno)]
+
+    def __getattr__(self, name):
+        return getattr(inspect, name)
+
+
+@contextlib.contextmanager
+def _vsc_fast_source_info():
+    """
+    Context manager making pyvsc object construction and randomize() capture
+    their source location without inspect.stack(). vsc.rand_obj.inspect is restored on exit
+    """
+    saved = vsc.rand_obj.inspect
+    vsc.rand_obj.inspect = _FastInspect()
+    try:
+        yield
+    finally:
+        vsc.rand_obj.inspect = saved
+
+def _solver_randomize_many(cls, n, seed, field_values):
+    """Per-object pyvsc randomization, seeded per object index"""
+    objs = []
+    for i in range(n):
+        obj = cls(**field_values)
+        obj.set_randstate(RandState.mkFromSeed(seed, str(i)))
+        obj.randomize()
+        objs.append(obj)
+    return objs
+
+def _bulk_sampler(obj):
+    """
+    Analyzes the constraint model of obj
+    Returns a list of (field model, [(lo, hi, weight), ...]) buckets per rand field,
+    or None when the constraints can't be sampled independently per field
+    """
+    if hasattr(obj, 'pre_randomize'):
+        return None
+    model = obj.get_model()
+    domains = {}
+    dists = {}
+    for field_model in model.field_l:
+        # Fields with rand_mode off keep their value, and numpy can't draw wider than 64 bits
+        if type(field_model) not in (FieldScalarModel, EnumFieldModel) or field_model.width > 64 or \
+                not (field_model.is_declared_rand and field_model.rand_mode):
+            return None
+        if type(field_model) is EnumFieldModel:
+            domains[field_model] = [(v, v) for v in sorted(set(field_model.enums))]
+        elif field_model.is_signed:
+            domains[field_model] = [(-(1 << (field_model.width-1)), (1 << (field_model.width-1)) - 1)]
+        else:
+            domains[field_model] = [(0, (1 << field_model.width) - 1)]
+
+    # Constraints between fields are resolved once one side is pinned to a single value
+    pending = [c for block in model.constraint_model_l if block.enabled for c in block.constraint_l]
+    while pending:
+        deferred = []
+        for c in pending:
+            if type(c) is ConstraintDistModel:
+                field_model = _constraint_field(c.lhs, domains)
+                weights = [_dist_weight(w) for w in c.weights]
+                if field_model is None or field_model in dists or None in weights:
+                    return None
+                dists[field_model] = weights
+                domains[field_model] = _intersect(domains[field_model], [(lo, hi) for lo, hi, _ in weights])
+            elif type(c) is ConstraintExprModel:
+                constraint = _expr_intervals(c.e, domains)
+                if constraint is None:
+                    deferred.append(c)
+                    continue
+                field_model, intervals = constraint
+                domains[field_model] = _intersect(domains[field_model], intervals)
+            else:
+                return None
+            if not domains[field_model]:
+                # Unsatisfiable, let the solver report it
+                return None
+        if len(deferred) == len(pending):
+            return None
+        pending = deferred
+
+    sampler = []
+    for field_model, domain in domains.items():
+        if field_model in dists:
+            buckets = []
+            for lo, hi, weight in dists[field_model]:
+                intervals = _intersect(domain, [(lo, hi)])
+                size = sum(i_hi - i_lo + 1 for i_lo, i_hi in intervals)
+                buckets += [(i_lo, i_hi, weight * (i_hi - i_lo + 1) / size)
+                            for i_lo, i_hi in intervals if weight > 0]
+        else:
+            buckets = [(lo, hi, hi - lo + 1) for lo, hi in domain]
+        if not buckets:
+            # Unsatisfiable, let the solver report it
+            return None
+        sampler.append((field_model, buckets))
+    return sampler
+
+def _constraint_field(expr, domains):
+    """Returns the field model referenced by expr, if it's one of the sampled fields"""
+    if type(expr) is ExprFieldRefModel and expr.fm in domains:
+        return expr.fm
+    return None
+
+def _literal(expr, domains=None):
+    """Returns the value of a constant expression or of a field pinned to a single value, or None"""
+    if type(expr) is ExprLiteralModel:
+        return int(expr.val())
+    if domains is not None and type(expr) is ExprFieldRefModel and expr.fm in domains:
+        domain = domains[expr.fm]
+        if len(domain) == 1 and domain[0][0] == domain[0][1]:
+            return domain[0][0]
+    return None
+
+def _dist_weight(weight):
+    """Returns (lo, hi, weight) for a dist weight with constant range and weight"""
+    lo = _literal(weight.rng_lhs)
+    hi = lo if weight.rng_rhs is None else _literal(weight.rng_rhs)
+    value = _literal(weight.weight)
+    if None in (lo, hi, value) or value < 0:
+        return None
+    return (lo, hi, value)
+
+_swapped_ops = {BinExprType.Eq: BinExprType.Eq, BinExprType.Ne: BinExprType.Ne,
+                BinExprType.Lt: BinExprType.Gt, BinExprType.Le: BinExprType.Ge,
+                BinExprType.Gt: BinExprType.Lt, BinExprType.Ge: BinExprType.Le}
+
+def _expr_intervals(expr, domains):
+    """
+    Converts a single field constraint to (field model, allowed intervals)
+    Supports 'field in rangelist' and comparisons between a field and a constant or pinned field
+    """
+    if type(expr) is ExprInModel:
+        field_model = _constraint_field(expr.lhs, domains)
+        if field_model is None:
+            return None
+        intervals = []
+        for rng in expr.rhs.rl:
+            if type(rng) is ExprRangeModel:
+                lo, hi = _literal(rng.lhs, domains), _literal(rng.rhs, domains)
+            else:
+                lo = hi = _literal(rng, domains)
+            if lo is None or hi is None:
+                return None
+            intervals.append((lo, hi))
+        return field_model, _intersect(intervals, intervals)
+
+    if type(expr) is ExprBinModel and expr.op in _swapped_ops:
+        field_model, value, op = _constraint_field(expr.lhs, domains), _literal(expr.rhs, domains), expr.op
+        if field_model is None or value is None:
+            field_model, value, op = _constraint_field(expr.rhs, domains), _literal(expr.lhs, domains), _swapped_ops[expr.op]
+        if field_model is None or value is None:
+            return None
+        if not domains[field_model]:
+            return field_model, []
+        lo, hi = domains[field_model][0][0], domains[field_model][-1][1]
+        intervals = {BinExprType.Eq: [(value, value)],
+                     BinExprType.Ne: [(lo, value-1), (value+1, hi)],
+                     BinExprType.Lt: [(lo, value-1)],
+                     BinExprType.Le: [(lo, value)],
+                     BinExprType.Gt: [(value+1, hi)],
+                     BinExprType.Ge: [(value, hi)]}[op]
+        return field_model, intervals
+    return None
+
+def _intersect(a, b):
+    """Intersects two lists of inclusive (lo, hi) intervals, returning sorted disjoint intervals"""
+    result = []
+    for a_lo, a_hi in a:
+        for b_lo, b_hi in b:
+            lo, hi = max(a_lo, b_lo), min(a_hi, b_hi)
+            if lo <= hi:
+                result.append((lo, hi))
+    result.sort()
+    merged = []
+    for lo, hi in result:
+        if merged and lo <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], hi))
+        else:
+            merged.append((lo, hi))
+    return merged
+
+def _sample_buckets(rng, buckets, n, is_signed):
+    """Draws n values: a bucket is picked by weight, then a value uniformly within it"""
+    import numpy as np
+    dtype = np.int64 if is_signed else np.uint64
+    if len(buckets) == 1:
+        lo, hi, _ = buckets[0]
+        return rng.integers(lo, hi, size=n, dtype=dtype, endpoint=True)
+    weights = np.array([float(weight) for _, _, weight in buckets])
+    counts = rng.multinomial(n, weights / weights.sum())
+    column = np.concatenate([rng.integers(lo, hi, size=count, dtype=dtype, endpoint=True)
+                             for (lo, hi, _), count in zip(buckets, counts)])
+    rng.shuffle(column)
+    return column
+
+def _array_field_name(field_model):
+    """Structured array column name, the non-rand field name for rand_ fields"""
+    name = field_model.name
+    return name[len('rand_'):] if name.startswith('rand_') else name
+
+def _array_dtype(obj):
+    """Structured array dtype with one integer column per rand field, sized by bit width"""
+    import numpy as np
+    dtype = []
+    for field_model in obj.get_model().field_l:
+        assert field_model.width <= 64, \
+            f"as_array supports fields up to 64 bits, {_array_field_name(field_model)} has {field_model.width}"
+        width = next(w for w in (8, 16, 32, 64) if field_model.width <= w)
+        dtype.append((_array_field_name(field_model), f"{'i' if field_model.is_signed else 'u'}{width // 8}"))
+    return np.dtype(dtype)
+
+def _objs_to_array(objs, prototype):
+    """Converts randomized objects to the structured array form"""
+    import numpy as np
+    array = np.empty(len(objs), dtype=_array_dtype(prototype))
+    for field_model in prototype.get_model().field_l:
+        array[_array_field_name(field_model)] = [int(obj.get_model().field_l[field_model.idx].get_val()) for obj in objs]
+    return array
@@ -6,13 +6,10 @@ Copyright (c) Microsoft Corporation.
 Author: jonathan.george@microsoft.com
 """
 
-from ruamel.yaml.comments import CommentedMap
-from ruamel.yaml import SafeConstructor
-from copy import deepcopy
 from enum import Enum
 import dataclasses
 import traceback
-from datagenDV import ParamsBase
+from datagenDV.params_base import ParamsBase, field_items
 
 
 def field(default, dir='in_out', **kwargs):
@@ -63,42 +60,64 @@ def check_immutable(init_val):
 def convert_enum(x):
     return x.name if isinstance(x, Enum ) else x
 
+#Names of the fields to_yaml skips, computed once per class
+_yml_dump_excluded_cache = {}
+
+def yml_dump_excluded(cls):
+    """Returns the set of field names of cls which are excluded from to_yaml"""
+    excluded = _yml_dump_excluded_cache.get(cls)
+    if excluded is None:
+        excluded = set()
+        if dataclasses.is_dataclass(cls):
+            excluded.update(field.name for field in dataclasses.fields(cls) if field.metadata.get('yml_dump_excluded',False))
+        if getattr(cls, '_ro_init', False):
+            #pyvsc randobj bookkeeping attribute
+            excluded.add('tname')
+        excluded = _yml_dump_excluded_cache[cls] = frozenset(excluded)
+    return excluded
+
 class YAMLParamsBase(ParamsBase):
     """
     Base command class for yaml loaded classes
-    Using Python Dataclasses is recommended
+    Using Python Dataclasses is recommended, dataclass(slots=True) is supported
 
     """
+    __slots__ = ()
+
     @classmethod
     def to_yaml(cls,dumper,data):
-        new_data = deepcopy(data)
-        #Get the varibables of object without built in functions
-        vars_dir = [x for x in vars(new_data)]
-        if dataclasses.is_dataclass(cls):
-            yml_dump_excluded_fields = [field.name for field in dataclasses.fields(cls) if field.metadata.get('yml_dump_excluded',False)]
-        else:
-            yml_dump_excluded_fields = []
-
-        for var_name in vars_dir:
-            var_val = new_data.__dict__[var_name]
+        """
+        Represents data as a mapping built directly from the live object. Nothing is copied
+        Private, None and yml_dump_excluded fields are skipped and enums are dumped by name
+        """
+        yml_dump_excluded_fields = yml_dump_excluded(cls)
+        state = {}
+        empty_lists = []
+        for var_name, var_val in field_items(data):
             #Do not dump private variables or None or field is _yml_in_field
-            if var_val == None or var_name.startswith('_') or  var_name in yml_dump_excluded_fields:
-                del new_data.__dict__[var_name]
-            elif isinstance(var_val, list):
-                if len(var_val) == 0: #Do not dump if it is an empty list
-                    del new_data.__dict__[var_name]
-                #handle lists of enums
-                new_data.__dict__[var_name] = list(map( convert_enum, var_val))
+            if var_val is None or var_name.startswith('_') or var_name in yml_dump_excluded_fields:
+                continue
+            if isinstance(var_val, list):
+                if len(var_val) == 0:
+                    #Empty lists are dumped after all other fields
+                    empty_lists.append(var_name)
+                else:
+                    #handle lists of enums
+                    state[var_name] = list(map(convert_enum, var_val))
             else:
                 #Convert any enums
-                new_data.__dict__[var_name] = convert_enum(var_val)
+                state[var_name] = convert_enum(var_val)
+        for var_name in empty_lists:
+            state[var_name] = []
         #The ! tag gets dropped by default due to issues with further scripts
         yaml_tag = '!'#u'!' + cls.__name__
-        return dumper.represent_yaml_object(yaml_tag, new_data, cls)
+        return dumper.represent_mapping(yaml_tag, state)
 
     @classmethod
     def from_yaml(cls, loader, node):
         if not isinstance(node, dict):
+            #ruamel is only imported by the yaml loading flows
+            from ruamel.yaml import SafeConstructor
             node  = SafeConstructor.construct_mapping(loader, node, deep=True)
         node.pop("DatagenClass", None)
         return cls( **dict(node) )